@@ -1,167 +1,349 @@
 from fastapi import APIRouter, HTTPException
 from connect.config import redis_conn
+import re
 import time
 import json
+import asyncio
 import threading
-from typing import Optional, Dict, Any
+import msgpack
+from redis.client import NEVER_DECODE
+from typing import Optional, Dict, Any, List
+
+from util.lru import LRUCache
+from models.schema import BatchResultRequest, MAX_BATCH_SIZE
 
 router = APIRouter(prefix="/api")
 
+# Shared cache accounting, kept outside the cache:* namespace
+CACHE_STATS_KEY = "stats:cache"
+CACHE_WRITES_KEY = "stats:cache:written:{window}"
+
+MAINTENANCE_INTERVAL = 60     # seconds between maintenance runs
+MAINTENANCE_BUDGET = 0.05     # seconds of SCAN work per run
+MAINTENANCE_SCAN_COUNT = 100  # keys per SCAN call
+MAINTENANCE_LOCK_KEY = "lock:cache_maintenance"
+
 class Cache:
-    """Thread-safe cache implementation using Redis"""
+    """
+    Two tier read-through cache for finished job results.
+    Tier one is an in-process LRU checked before any Redis call, tier two is
+    Redis (cache:{id}) shared by every API process. Expiry is left to SETEX.
+
+    Accounting is updated as entries are written and read, so stats never
+    have to walk the keyspace: writes bump a shared counter and a HyperLogLog
+    per TTL window, hit/miss counts are kept per process and flushed as deltas.
+    """
     
-    def __init__(self, redis_client, default_ttl: int = 60):
+    def __init__(self, redis_client, default_ttl: int = 60, local_size: int = 2048):
         self.redis = redis_client
         self.default_ttl = default_ttl
+        self.local = LRUCache(max_size=local_size, ttl=default_ttl)
+        self.counters = {"local_hits": 0, "local_misses": 0, "redis_hits": 0, "redis_misses": 0}
+        self._flushed = dict(self.counters)
         self._local_lock = threading.Lock()
+
+    def _count(self, name: str):
+        with self._local_lock:
+            self.counters[name] += 1
+
+    def shared_key(self, key: str) -> str:
+        return f"cache:{key}"
+
+    def writes_key(self, window: int) -> str:
+        return CACHE_WRITES_KEY.format(window=window)
+
+    def current_window(self) -> int:
+        return int(time.time() // self.default_ttl)
+
+    def get_local(self, key: str) -> Optional[Dict[str, Any]]:
+        """Tier one lookup, no I/O"""
+        value = self.local.get(key)
+        self._count("local_hits" if value is not None else "local_misses")
+        return value
+
+    def from_shared(self, key: str, cached_data: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Decode a tier two value fetched by the caller, promoting hits to tier one"""
+        if cached_data:
+            try:
+                value = json.loads(cached_data)
+                self.local.set(key, value)
+                self._count("redis_hits")
+                return value
+            except json.JSONDecodeError:
+                pass
+
+        self._count("redis_misses")
+        return None
         
-    def get(self, key: str) -> Optional[Dict[str, Any]]:
-        """Get a value from cache with thread safety"""
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a value from the local tier, then Redis"""
+        value = self.get_local(key)
+        if value is not None:
+            return value
+
         try:
-            # First, try to get from Redis
-            cached_data = self.redis.get(f"cache:{key}")
-            
-            if cached_data:
-                try:
-                    data = json.loads(cached_data)
-                    # Check if still valid
-                    if time.time() - data.get("timestamp", 0) < self.default_ttl:
-                        return data.get("data")
-                except json.JSONDecodeError:
-                    # Invalid cache data, remove it
-                    self.redis.delete(f"cache:{key}")
-            
-            return None
-            
+            return self.from_shared(key, await self.redis.get(self.shared_key(key)))
         except Exception as e:
             print(f"Cache get error for {key}: {str(e)}")
             return None
     
-    def set(self, key: str, value: Dict[str, Any], ttl: Optional[int] = None) -> bool:
-        """Set a value in cache with thread safety"""
-        try:
-            ttl = ttl or self.default_ttl
-            
-            cache_entry = {
-                "timestamp": time.time(),
-                "data": value
-            }
-            
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[int] = None) -> bool:
+        """Set a value in both tiers"""
+        return await self.set_many({key: value}, ttl)
+
+    async def set_many(self, values: Dict[str, Dict[str, Any]], ttl: Optional[int] = None) -> bool:
+        """Set several values in both tiers, one Redis round trip"""
+        ttl = ttl or self.default_ttl
+        if not values:
+            return True
+
+        # Count the writes and remember the ids for this TTL window, same round trip
+        writes_key = self.writes_key(self.current_window())
+        pipe = self.redis.pipeline(transaction=False)
+        for key, value in values.items():
+            self.local.set(key, value, ttl)
             # Use Redis SETEX for atomic set with expiration
-            return self.redis.setex(
-                f"cache:{key}",
-                ttl,
-                json.dumps(cache_entry)
-            )
-            
+            pipe.setex(self.shared_key(key), ttl, json.dumps(value))
+        pipe.hincrby(CACHE_STATS_KEY, "writes", len(values))
+        pipe.pfadd(writes_key, *values)
+        pipe.expire(writes_key, self.default_ttl * 2)
+
+        try:
+            return all((await pipe.execute())[:len(values)])
         except Exception as e:
-            print(f"Cache set error for {key}: {str(e)}")
+            print(f"Cache set error for {', '.join(values)}: {str(e)}")
             return False
     
-    def delete(self, key: str) -> bool:
-        """Delete a value from cache"""
+    async def delete(self, key: str) -> bool:
+        """Delete a value from both tiers"""
+        self.local.delete(key)
         try:
-            return self.redis.delete(f"cache:{key}") > 0
+            return await self.redis.delete(self.shared_key(key)) > 0
         except Exception as e:
             print(f"Cache delete error for {key}: {str(e)}")
             return False
 
-# Initialize cache with shorter TTL for in-progress jobs
-job_cache = Cache(redis_conn, default_ttl=30)
+    async def flush_stats(self):
+        """Add this process's hit/miss counts since the last flush to the shared totals"""
+        with self._local_lock:
+            counters = dict(self.counters)
+        deltas = {name: counters[name] - self._flushed[name] for name in counters}
+        if not any(deltas.values()):
+            return
+
+        pipe = self.redis.pipeline(transaction=False)
+        for name, delta in deltas.items():
+            if delta:
+                pipe.hincrby(CACHE_STATS_KEY, name, delta)
+        await pipe.execute()
+        self._flushed = counters
+
+    async def shared_stats(self) -> Dict[str, Any]:
+        """
+        Totals across all API processes, and an estimate of live entries:
+        distinct ids written in the current and previous TTL window (an upper bound)
+        """
+        window = self.current_window()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hgetall(CACHE_STATS_KEY)
+        pipe.pfcount(self.writes_key(window), self.writes_key(window - 1))
+        totals, live_estimate = await pipe.execute()
+
+        return {
+            "live_entries_estimate": live_estimate,
+            "totals": {name: int(value) for name, value in totals.items()}
+        }
+
+    def hit_ratios(self) -> Dict[str, Any]:
+        """Per tier hit counts and ratios for this process"""
+        with self._local_lock:
+            counters = dict(self.counters)
+
+        def ratio(hits, misses):
+            return round(hits / (hits + misses), 4) if hits + misses else None
+
+        return {
+            "local": {
+                "hits": counters["local_hits"],
+                "misses": counters["local_misses"],
+                "hit_ratio": ratio(counters["local_hits"], counters["local_misses"]),
+                "size": len(self.local)
+            },
+            "redis": {
+                "hits": counters["redis_hits"],
+                "misses": counters["redis_misses"],
+                "hit_ratio": ratio(counters["redis_hits"], counters["redis_misses"])
+            }
+        }
+
+# Finished results never change, so they can be cached for a while
+job_cache = Cache(redis_conn, default_ttl=300)
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+# Result record versions written by the runners (see runners/common/process.py)
+RESULT_RECORD_VERSIONS = (1,)
+
+# Job hash fields read per lookup, `result` only exists on jobs finished by older workers
+JOB_FIELDS = ("record", "status", "error", "result", "created_at", "language", "filename")
+
+def decode_field(value: Optional[bytes]) -> Optional[str]:
+    return value.decode() if value is not None else None
+
+def build_result(job_id: str, fields: List[Optional[bytes]]) -> Dict[str, Any]:
+    """Client facing result from the job's JOB_FIELDS, as read with NEVER_DECODE"""
+    record, status, error, legacy_result, created_at, language, filename = fields
+
+    # Finished job: the record is the response, decoded once and passed through
+    if record is not None:
+        result = msgpack.unpackb(record, raw=False)
+        if result.get("v") not in RESULT_RECORD_VERSIONS:
+            print(f"Unknown result record version {result.get('v')} for job {job_id}")
+            raise ValueError("Unsupported result record version")
+        return result
+
+    if status is None:
+        return {"status": "unknown", "result": None}
+
+    result = {
+        "status": decode_field(status),
+        "result": None,
+        "error": decode_field(error),
+        "job_info": {
+            "created_at": decode_field(created_at),
+            "language": decode_field(language),
+            "filename": decode_field(filename)
+        }
+    }
+
+    # Written by workers from before the result record, a single JSON document
+    if legacy_result is not None:
+        try:
+            result["result"] = json.loads(legacy_result)
+        except json.JSONDecodeError:
+            result["result"] = decode_field(legacy_result)
+
+    return result
+
+def queue_result_reads(pipe, job_id: str):
+    """Shared cache entry and job fields, the job fields undecoded since the record is msgpack"""
+    pipe.get(job_cache.shared_key(job_id))
+    pipe.execute_command("HMGET", f"job:{job_id}", *JOB_FIELDS, **{NEVER_DECODE: True})
+
+async def fetch_job_result(job_id: str) -> Dict[str, Any]:
+    """Build the client facing result for a job, caching only completed jobs"""
+
+    # Finished jobs are usually served from this process's memory
+    cached_result = job_cache.get_local(job_id)
+    if cached_result is not None:
+        return cached_result
+
+    # Shared cache and job fields in one round trip
+    pipe = redis_conn.pipeline(transaction=False)
+    queue_result_reads(pipe, job_id)
+    cached_data, fields = await pipe.execute()
+
+    cached_result = job_cache.from_shared(job_id, cached_data)
+    if cached_result is not None:
+        return cached_result
+
+    result = build_result(job_id, fields)
+
+    # Only cache completed or failed jobs
+    if result["status"] in TERMINAL_STATUSES:
+        await job_cache.set(job_id, result)
+    
+    return result
+
+async def fetch_job_results(job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """fetch_job_result for many jobs, with a single Redis round trip for those not cached locally"""
+    results = {}
+    missing = []
+    for job_id in job_ids:
+        cached_result = job_cache.get_local(job_id)
+        if cached_result is not None:
+            results[job_id] = cached_result
+        else:
+            missing.append(job_id)
+
+    if not missing:
+        return results
+
+    pipe = redis_conn.pipeline(transaction=False)
+    for job_id in missing:
+        queue_result_reads(pipe, job_id)
+    responses = await pipe.execute()
+
+    finished = {}
+    for i, job_id in enumerate(missing):
+        cached_data, fields = responses[2 * i], responses[2 * i + 1]
+
+        cached_result = job_cache.from_shared(job_id, cached_data)
+        if cached_result is not None:
+            results[job_id] = cached_result
+            continue
+
+        result = build_result(job_id, fields)
+        if result["status"] in TERMINAL_STATUSES:
+            finished[job_id] = result
+        results[job_id] = result
+
+    # Only cache completed or failed jobs
+    await job_cache.set_many(finished)
+
+    return results
 
 @router.get("/get_result/{job_id}")
-def get_job_result(job_id: str):
+async def get_job_result(job_id: str):
     """Get job result with caching only for completed jobs"""
     
     # Validate job_id
-    import re
     if not re.match(r'^[a-zA-Z0-9\-]+$', job_id):
         raise HTTPException(status_code=400, detail="Invalid job ID")
     
     # Get job from Redis
     try:
-        job = redis_conn.hgetall(f"job:{job_id}")
-        print(f"Redis job data for {job_id}: {job}")
-        
-        if not job:
-            return {"status": "unknown", "result": None}
-        
-        # Get status first
-        status = job.get("status", "unknown")
-        
-        # Check cache only for completed or failed jobs
-        if status in ["completed", "failed"]:
-            cached_result = job_cache.get(job_id)
-            if cached_result:
-                print(f"Cache hit for job {job_id}: {cached_result}")
-                return cached_result
-        
-        # Build result
-        result = {
-            "status": status,
-            "result": job.get("result"),
-            "error": job.get("error"),  # Add error field if present
-            "job_info": {  # Add debug info
-                "created_at": job.get("created_at"),
-                "language": job.get("language"),
-                "filename": job.get("filename")
-            }
-        }
-        
-        # Parse result if needed
-        if result["result"]:
-            try:
-                # If it's a string, try to parse it as JSON
-                if isinstance(result["result"], str):
-                    parsed_result = json.loads(result["result"])
-                    
-                    # Check if the parsed result is still a string that looks like JSON
-                    if isinstance(parsed_result, str) and parsed_result.startswith('{') and parsed_result.endswith('}'):
-                        try:
-                            # Try to parse one more time
-                            result["result"] = json.loads(parsed_result)
-                        except json.JSONDecodeError:
-                            # If it fails, use the first parsed result
-                            result["result"] = parsed_result
-                    else:
-                        result["result"] = parsed_result
-                    
-                    # Fix inconsistent status - if status is failed but result shows success
-                    if result["status"] == "failed" and isinstance(result["result"], dict) and result["result"].get("success") == True:
-                        print(f"Fixing inconsistent status for job {job_id}: status was 'failed' but result shows success")
-                        result["status"] = "completed"
-                        # Update Redis for future requests
-                        redis_conn.hset(f"job:{job_id}", "status", "completed")
-                else:
-                    result["result"] = parsed_result
-
-            except json.JSONDecodeError:
-                # Keep as string if not valid JSON
-                pass
-        
-        # Only cache completed or failed jobs
-        if status in ["completed", "failed"]:
-            job_cache.set(job_id, result)
-        
-        return result
+        return await fetch_job_result(job_id)
         
     except Exception as e:
         print(f"Error fetching job {job_id}: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@router.post("/get_results")
+async def get_job_results(request: BatchResultRequest):
+    """Results of several jobs in one call, keyed by job id"""
+
+    job_ids = list(dict.fromkeys(request.job_ids))
+    if not job_ids:
+        raise HTTPException(status_code=400, detail="No job IDs given")
+    if len(job_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Too many job IDs (max {MAX_BATCH_SIZE})")
+    for job_id in job_ids:
+        if not re.match(r'^[a-zA-Z0-9\-]+$', job_id):
+            raise HTTPException(status_code=400, detail=f"Invalid job ID: {job_id}")
+
+    try:
+        return {"results": await fetch_job_results(job_ids)}
+
+    except Exception as e:
+        print(f"Error fetching jobs {', '.join(job_ids)}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 # Cache management endpoints for monitoring
 @router.get("/cache/stats")
-def get_cache_stats():
+async def get_cache_stats():
     """Get cache statistics (requires admin privileges)"""
     try:
         # Get basic Redis info
-        info = redis_conn.info()
+        info = await redis_conn.info()
         
-        # Count cache keys
-        cache_keys = redis_conn.keys("cache:*")
+        # Counters maintained on write, no keyspace walk
+        shared = await job_cache.shared_stats()
         
         return {
-            "total_cache_keys": len(cache_keys),
+            "total_cache_keys": shared["live_entries_estimate"],
+            "totals": shared["totals"],
+            "tiers": job_cache.hit_ratios(),
             "redis_memory_used": info.get("used_memory_human"),
             "redis_connected_clients": info.get("connected_clients"),
             "redis_uptime_seconds": info.get("uptime_in_seconds")
@@ -170,41 +352,55 @@ def get_cache_stats():
         raise HTTPException(status_code=500, detail=f"Failed to get cache stats: {str(e)}")
 
 @router.delete("/cache/{job_id}")
-def clear_job_cache(job_id: str):
+async def clear_job_cache(job_id: str):
     """Clear cache for a specific job (requires admin privileges)"""
     try:
-        success = job_cache.delete(job_id)
+        success = await job_cache.delete(job_id)
         return {"success": success, "job_id": job_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to clear cache: {str(e)}")
 
-def background_cache_cleanup():
-    """Background task to clean expired cache entries"""
+async def expire_cache_slice(cursor: int) -> int:
+    """
+    Walk cache:* incrementally, giving a TTL to entries that have none (written
+    before SETEX was used). Stops after MAINTENANCE_BUDGET seconds and returns the
+    cursor to resume from, 0 once the keyspace has been covered.
+    """
+    deadline = time.monotonic() + MAINTENANCE_BUDGET
+
+    while True:
+        cursor, keys = await redis_conn.scan(cursor, match="cache:*", count=MAINTENANCE_SCAN_COUNT)
+
+        if keys:
+            pipe = redis_conn.pipeline(transaction=False)
+            for key in keys:
+                pipe.ttl(key)
+            ttls = await pipe.execute()
+
+            pipe = redis_conn.pipeline(transaction=False)
+            for key, ttl in zip(keys, ttls):
+                if ttl == -1:
+                    pipe.expire(key, job_cache.default_ttl)
+            await pipe.execute()
+
+        if cursor == 0 or time.monotonic() > deadline:
+            return cursor
+
+async def background_cache_maintenance():
+    """
+    Background task started with the app: flushes this process's cache counters
+    and runs a time boxed slice of the TTL sweep. Only one API process sweeps per interval.
+    """
+    cursor = 0
     while True:
         try:
-            # Get all cache keys
-            cache_keys = redis_conn.keys("cache:*")
-            
-            for key in cache_keys:
-                # Get the cached data
-                cached_data = redis_conn.get(key)
-                if cached_data:
-                    try:
-                        data = json.loads(cached_data)
-                        # Remove if expired
-                        if time.time() - data.get("timestamp", 0) > 60:  # Default TTL
-                            redis_conn.delete(key)
-                    except json.JSONDecodeError:
-                        # Invalid cache data, remove it
-                        redis_conn.delete(key)
-            
-            # Sleep for 5 minutes
-            time.sleep(300)
-            
-        except Exception as e:
-            print(f"Cache cleanup error: {str(e)}")
-            time.sleep(300)
+            await asyncio.sleep(MAINTENANCE_INTERVAL)
+            await job_cache.flush_stats()
 
-# Start background cleanup thread
-cleanup_thread = threading.Thread(target=background_cache_cleanup, daemon=True)
-cleanup_thread.start()
\ No newline at end of file
+            if await redis_conn.set(MAINTENANCE_LOCK_KEY, "1", nx=True, ex=MAINTENANCE_INTERVAL):
+                cursor = await expire_cache_slice(cursor)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Cache maintenance error: {str(e)}")
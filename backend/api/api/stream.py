@@ -0,0 +1,188 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from connect.config import redis_conn, blocking_redis_conn, REDIS_BLOCKING_MAX_CONNECTIONS
+from api.result import fetch_job_result, TERMINAL_STATUSES
+import asyncio
+import json
+import re
+import time
+from typing import Dict, Set
+
+router = APIRouter(prefix="/api")
+
+KEEPALIVE_INTERVAL = 15   # seconds between SSE comments while waiting
+STREAM_TIMEOUT = 120      # give up and send the current state after this long
+OUTPUT_BATCH = 500        # max output chunks returned per request
+MAX_OUTPUT_WAIT = 10000   # max long-poll time for new output, in ms
+POLL_INTERVAL = 0.25      # seconds between reads of a long-poll without a blocking connection
+
+# One blocking connection per long-poll, polls beyond that re-read instead
+long_polls = asyncio.Semaphore(REDIS_BLOCKING_MAX_CONNECTIONS)
+
+class JobNotifier:
+    """
+    Completion notifications from workers (published on job_done:{id}).
+    One pattern subscription per API process, fanned out to waiting requests.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+        self._waiters: Dict[str, Set[asyncio.Future]] = {}
+        self._task = None
+        self._ready = None
+
+    async def _ensure_listening(self):
+        if self._task is None or self._task.done():
+            self._ready = asyncio.get_running_loop().create_future()
+            self._task = asyncio.create_task(self._listen())
+        await asyncio.shield(self._ready)
+
+    async def _listen(self):
+        while True:
+            pubsub = self.redis.pubsub()
+            try:
+                await pubsub.psubscribe("job_done:*")
+                async for message in pubsub.listen():
+                    if message["type"] == "psubscribe":
+                        # Subscription is live, waiters can check job state now
+                        if not self._ready.done():
+                            self._ready.set_result(True)
+                    elif message["type"] == "pmessage":
+                        job_id = message["channel"].split(":", 1)[1]
+                        for waiter in self._waiters.pop(job_id, ()):
+                            if not waiter.done():
+                                waiter.set_result(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Job notification listener error: {str(e)}")
+                if not self._ready.done():
+                    self._ready.set_result(False)
+                # Wake everyone so they re-read the job instead of waiting forever
+                for waiters in self._waiters.values():
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_result(None)
+                self._waiters.clear()
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    async def watch(self, job_id: str) -> asyncio.Future:
+        """Future resolved when job_id completes, register before reading job state"""
+        await self._ensure_listening()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(job_id, set()).add(waiter)
+        return waiter
+
+    def unwatch(self, job_id: str, waiter: asyncio.Future):
+        waiters = self._waiters.get(job_id)
+        if waiters:
+            waiters.discard(waiter)
+            if not waiters:
+                del self._waiters[job_id]
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+
+notifier = JobNotifier(redis_conn)
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.get("/stream_result/{job_id}")
+async def stream_job_result(job_id: str):
+    """
+    Server-Sent Events alternative to polling get_result.
+    Sends a single `result` event once the job completes or fails.
+    """
+
+    if not re.match(r'^[a-zA-Z0-9\-]+$', job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+
+    async def events():
+        waiter = await notifier.watch(job_id)
+        try:
+            result = await fetch_job_result(job_id)
+            started = time.time()
+
+            while result["status"] not in TERMINAL_STATUSES and result["status"] != "unknown":
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter), KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    if time.time() - started > STREAM_TIMEOUT:
+                        break
+                    yield ": keepalive\n\n"
+                else:
+                    # Watch again in case this was a listener reset, not a completion
+                    notifier.unwatch(job_id, waiter)
+                    waiter = await notifier.watch(job_id)
+
+                # Re-read on every wake up, so a missed notification costs at most one interval
+                result = await fetch_job_result(job_id)
+
+            yield sse_event("result", result)
+        except Exception as e:
+            print(f"Error streaming job {job_id}: {str(e)}")
+            yield sse_event("error", {"detail": "Internal server error"})
+        finally:
+            notifier.unwatch(job_id, waiter)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def read_output(key: str, offset: str, wait: int):
+    """
+    XREAD output entries after offset, waiting up to `wait` ms for some.
+    Blocks in Redis while a blocking connection is free, otherwise re-reads
+    every POLL_INTERVAL without holding a connection in between.
+    """
+    if wait and not long_polls.locked():
+        async with long_polls:
+            return await blocking_redis_conn.xread({key: offset}, count=OUTPUT_BATCH, block=wait)
+
+    deadline = time.monotonic() + wait / 1000
+    while True:
+        response = await redis_conn.xread({key: offset}, count=OUTPUT_BATCH)
+        remaining = deadline - time.monotonic()
+        if response or remaining <= 0:
+            return response
+        await asyncio.sleep(min(POLL_INTERVAL, remaining))
+
+@router.get("/get_output/{job_id}")
+async def get_job_output(job_id: str, offset: str = "0-0", wait: int = 0):
+    """
+    Output chunks of a streaming job (submitted with stream=true) after `offset`.
+    Pass the returned next_offset back to resume; `wait` long-polls for new chunks (ms).
+    """
+
+    if not re.match(r'^[a-zA-Z0-9\-]+$', job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+    if not re.match(r'^\d+-\d+$', offset):
+        raise HTTPException(status_code=400, detail="Invalid offset")
+
+    wait = max(0, min(wait, MAX_OUTPUT_WAIT))
+
+    try:
+        response = await read_output(f"output:{job_id}", offset, wait)
+    except Exception as e:
+        print(f"Error reading output for job {job_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+    chunks = []
+    done = False
+    next_offset = offset
+
+    for _, entries in response or []:
+        for entry_id, fields in entries:
+            next_offset = entry_id
+            if fields.get("stream") == "end":
+                done = True
+            else:
+                chunks.append({"offset": entry_id, "stream": fields.get("stream"), "data": fields.get("data")})
+
+    return {"chunks": chunks, "next_offset": next_offset, "done": done}
@@ -1,54 +1,29 @@
 from fastapi import Request, APIRouter, HTTPException
 from pydantic import BaseModel
 import os
+import json
 import uuid
 import re
+import hashlib
 from fastapi import Depends
 import time
 
-from models.schema import Language, CodeSubmission, SUPPORTED_LANGUAGES, BLOCKED_KEYWORDS, BLOCKED_PATTERNS
+from models.schema import Language, Priority, Profile, CodeSubmission, BatchSubmission, SUPPORTED_LANGUAGES, MAX_BATCH_SIZE
+from models.schema import MAX_TEST_CASES, MAX_TEST_INPUT_BYTES
 from connect.config import redis_conn
-from middleware.auth import require_api_key, verify_api_key
+from middleware.auth import require_api_key, verify_api_key, api_key_hash
+from util.scanner import scanner
 
 
 router = APIRouter(prefix="/api")
 
-# check for dangerous keywords asscoiates with that language
-def check_keywords(code:str, language: str):
-    for keyword in BLOCKED_KEYWORDS[language]:
-        if keyword.lower() in code.lower():
-            raise HTTPException(
-                status_code=400, 
-                detail=f"Dangerous keyword detected: {keyword}"
-            )
-
-# Check patterns via regex
-def check_patterns(code: str):
-    for pattern in BLOCKED_PATTERNS:
-        if pattern.search(code):
-            raise HTTPException(
-                status_code=400,
-                detail=f"Dangerous pattern detected: {pattern.pattern}"
-            )
-
-# Remove comments and strings (this makes it easier to check for malicious code)
-def normalize_code(code: str, language:str):
-    
- # Handle different language comment styles
-    if language in ["python"]:
-        code = re.sub(r'#.*$', '', code, flags=re.MULTILINE)
-        code = re.sub(r'""".*?"""', '', code, flags=re.DOTALL)
-        code = re.sub(r"'''.*?'''", '', code, flags=re.DOTALL)
-    elif language in ["javascript", "typescript", "java", "cpp", "c", "go"]:
-        code = re.sub(r'//.*$', '', code, flags=re.MULTILINE)
-        code = re.sub(r'/\*[\s\S]*?\*/', '', code, flags=re.DOTALL)
-    
-    # Better string literal removal - handle different quote styles
-    code = re.sub(r'"(?:\\.|[^"\\])*"', '""', code)  # Double quotes
-    code = re.sub(r"'(?:\\.|[^'\\])*'", "''", code)  # Single quotes
-    code = re.sub(r"`(?:\\.|[^`\\])*`", "``", code)  # Template literals
-    
-    return code
+# How long an identical submission keeps pointing at the same job
+DEDUP_TTL = int(os.getenv("DEDUP_TTL", "600"))
+
+# Lane streams of tenants that stop submitting are dropped after a day
+LANE_TTL = 86400
+
+JOB_TTL = 3600  # 1 hour
 
 # Check file details
 def validate_submission(submission):
@@ -71,46 +46,178 @@ def validate_submission(submission):
             status_code=400, 
             detail=f"Language not supported. Use one of: {', '.join(SUPPORTED_LANGUAGES)}"
         )
+
+    # Test case validation
+    if submission.test_cases is not None:
+        if not submission.test_cases:
+            raise HTTPException(status_code=400, detail="Test cases cannot be empty")
+        if len(submission.test_cases) > MAX_TEST_CASES:
+            raise HTTPException(status_code=400, detail=f"Too many test cases (max {MAX_TEST_CASES})")
+        for index, case in enumerate(submission.test_cases):
+            if len(case.stdin.encode()) > MAX_TEST_INPUT_BYTES:
+                raise HTTPException(status_code=400, detail=f"Test case {index}: input too large (max {MAX_TEST_INPUT_BYTES} bytes)")
     
     return True
 
-@router.post("/submit_code")
-@require_api_key
-async def execute(submission: CodeSubmission, request: Request):  # Rename for clarity
+# Test cases as stored on the job hash, None for a plain run
+def test_cases_of(submission):
+    if submission.test_cases is None:
+        return None
+    return json.dumps([case.model_dump() for case in submission.test_cases])
+
+# Hash of the submission, identical programs share a hash
+def submission_hash(submission, language_name: str):
+    code = submission.code.replace("\r\n", "\n").rstrip()
+    # A streaming client must not land on a non-streaming job, it would never see output
+    content = "\0".join([
+        language_name, Profile(submission.profile).value, submission.filename, code, test_cases_of(submission) or "",
+        str(int(submission.stream))
+    ])
+    return hashlib.sha256(content.encode()).hexdigest()
 
+# Validation and security scan, raises the HTTPException to send back
+def check_submission(submission):
     validate_submission(submission)
 
     # Normalize and security check
-    normalized_code = normalize_code(submission.code, submission.language)
-    check_keywords(normalized_code, submission.language)
-    check_patterns(normalized_code)
+    violation = scanner.cached_scan(submission.code, submission.language)
+    if violation:
+        raise HTTPException(status_code=400, detail=violation)
 
-    job_id = str(uuid.uuid4())
-    
-    # Prepare job data
-    job_data = {
+# Queue name of the submission's language
+def language_name_of(submission):
+    return str(submission.language).split('.')[-1].lower()  # Convert "Language.NAME" to "name"
+
+def new_job(submission, job_id: str):
+    job = {
         "id": job_id,
         "code": submission.code,
         "language": submission.language,
         "filename": submission.filename,
         "status": "queued",
+        "stream": int(submission.stream),
+        "profile": Profile(submission.profile).value,
         "created_at": time.time()  # Add timestamp
     }
+    if submission.test_cases is not None:
+        job["test_cases"] = test_cases_of(submission)
+    return job
 
+# Lane of a submission: its priority class and the hashed API key that sent it.
+# Workers serve the lanes of a language by deficit round robin, so a bulk run
+# from one key can't starve everyone else.
+def lane_of(submission, request: Request):
+    priority = Priority(submission.priority).value
+    return f"{priority}:{api_key_hash(request.headers.get('X-API-Key', ''))}"
 
-    # Store job data
-    redis_conn.hmset(f"job:{job_id}", job_data)
-    redis_conn.expire(f"job:{job_id}", 3600)  # 1 hour TTL
-    
-    # Add to language-specific queue
-    language_name = str(submission.language).split('.')[-1].lower()  # Convert "Language.NAME" to "name"
-    redis_conn.lpush(f"queue:{language_name}", job_id)
-    print(f"Pushed job {job_id} to queue:{language_name}")
-    
-    # Publish notification
-    redis_conn.publish("job_notifications", submission.language)
+# Create a job in one atomic step: store the hash with its TTL, append it to its
+# lane's stream (which is what wakes the orchestrator) and register the lane.
+# With a dedup key the submission hash is claimed first, and an identical job
+# that is queued, running or finished is returned instead of creating a new one.
+#   KEYS: job hash, lane stream, lane set, [dedup key]
+#   ARGV: job id, lane, job TTL, lane TTL, dedup TTL, field, value, ...
+# Returns the id of the job the submission ended up on.
+CREATE_JOB = """
+if KEYS[4] then
+    if not redis.call('SET', KEYS[4], ARGV[1], 'NX', 'EX', ARGV[5]) then
+        local existing = redis.call('GET', KEYS[4])
+        if existing then
+            -- Failed or expired jobs are not reused. The job key is derived here,
+            -- which is fine on the single Redis instance this runs against
+            local status = redis.call('HGET', 'job:' .. existing, 'status')
+            if status and status ~= 'failed' then
+                return existing
+            end
+        end
+        redis.call('SET', KEYS[4], ARGV[1], 'EX', ARGV[5])
+    end
+end
+
+redis.call('HSET', KEYS[1], unpack(ARGV, 6))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('XADD', KEYS[2], '*', 'job_id', ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+redis.call('SADD', KEYS[3], ARGV[2])
+return ARGV[1]
+"""
+create_job_script = redis_conn.register_script(CREATE_JOB)
+
+# Run CREATE_JOB for a submission, on its own or queued on a pipeline (client)
+async def create_job(submission, request: Request, job_id: str, client=None):
+    language_name = language_name_of(submission)
+    lane = lane_of(submission, request)
+
+    keys = [f"job:{job_id}", f"stream:{language_name}:{lane}", f"lanes:{language_name}"]
+    # Opt-in: attach to an identical job instead of queueing new work
+    if submission.dedup:
+        keys.append(f"dedup:{submission_hash(submission, language_name)}")
+
+    args = [job_id, lane, JOB_TTL, LANE_TTL, DEDUP_TTL]
+    for field, value in {**new_job(submission, job_id), "lane": lane}.items():
+        args += [field, value]
+
+    return await create_job_script(keys=keys, args=args, client=client)
+
+@router.post("/submit_code")
+@require_api_key
+async def execute(submission: CodeSubmission, request: Request):  # Rename for clarity
+
+    check_submission(submission)
+
+    job_id = str(uuid.uuid4())
+
+    # Store job data and add to its lane of the language's queue, one round trip
+    queued_id = await create_job(submission, request, job_id)
+
+    if queued_id != job_id:
+        print(f"Deduplicated submission onto job {queued_id}")
+        return {
+            "job_id": queued_id,
+            "message": "Job deduplicated",
+            "deduplicated": True
+        }
+
+    print(f"Pushed job {job_id} to {language_name_of(submission)}")
     
     return {
         "job_id": job_id,
         "message": "Job queued"
-    }
\ No newline at end of file
+    }
+
+@router.post("/submit_batch")
+@require_api_key
+async def execute_batch(batch: BatchSubmission, request: Request):
+    """
+    Queue several submissions at once. Every item is validated and scanned first,
+    so one bad item rejects the whole batch; then all jobs are created in one round trip.
+    Job ids are returned in submission order.
+    """
+
+    if not batch.submissions:
+        raise HTTPException(status_code=400, detail="Batch cannot be empty")
+    if len(batch.submissions) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch too large (max {MAX_BATCH_SIZE} submissions)")
+
+    for index, submission in enumerate(batch.submissions):
+        try:
+            check_submission(submission)
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=f"Submission {index}: {e.detail}")
+
+    # One CREATE_JOB per item, all in one pipeline. Scripts run in order, so an
+    # item identical to an earlier one in the batch lands on that job.
+    new_ids = [str(uuid.uuid4()) for _ in batch.submissions]
+    pipe = redis_conn.pipeline(transaction=False)
+    for submission, job_id in zip(batch.submissions, new_ids):
+        await create_job(submission, request, job_id, client=pipe)
+    job_ids = await pipe.execute()
+
+    deduplicated = [queued_id for queued_id, job_id in zip(job_ids, new_ids) if queued_id != job_id]
+    languages = sorted({language_name_of(submission) for submission in batch.submissions})
+    print(f"Pushed batch of {len(job_ids) - len(deduplicated)} jobs for {', '.join(languages)}")
+
+    return {
+        "job_ids": job_ids,
+        "message": "Jobs queued",
+        "deduplicated": deduplicated
+    }
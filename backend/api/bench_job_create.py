@@ -0,0 +1,104 @@
+"""
+Throughput benchmark for job creation against a local Redis.
+Compares the old four sequential commands (hset, expire, lpush, publish) with
+a MULTI pipeline of the same writes and with the CREATE_JOB script submit_code
+uses now, each from many concurrent clients:
+
+    python bench_job_create.py [jobs] [concurrency] [redis_url]
+
+Everything is written under bench:* and deleted afterwards. Point it at a
+throwaway Redis; with TLS and a remote server the gap between the three grows
+with the round trip time.
+"""
+
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+from redis.asyncio import Redis
+
+# api.submit builds the shared client on import, it only connects when used
+os.environ.setdefault("REDIS_HOST", "localhost")
+os.environ.setdefault("REDIS_PORT", "6379")
+from api.submit import CREATE_JOB  # noqa: E402
+
+CODE = "print(sum(i * i for i in range(1000)))\n" * 20
+
+
+def job_data(job_id):
+    return {
+        "id": job_id,
+        "code": CODE,
+        "language": "python",
+        "filename": "main.py",
+        "status": "queued",
+        "stream": 0,
+        "created_at": time.time(),
+    }
+
+
+async def sequential(conn, script, job_id):
+    await conn.hset(f"bench:job:{job_id}", mapping=job_data(job_id))
+    await conn.expire(f"bench:job:{job_id}", 3600)
+    await conn.lpush("bench:queue:python", job_id)
+    await conn.publish("bench:job_notifications", "python")
+
+
+async def transaction(conn, script, job_id):
+    pipe = conn.pipeline()
+    pipe.hset(f"bench:job:{job_id}", mapping=job_data(job_id))
+    pipe.expire(f"bench:job:{job_id}", 3600)
+    pipe.xadd("bench:stream:python:normal:bench", {"job_id": job_id})
+    pipe.expire("bench:stream:python:normal:bench", 3600)
+    pipe.sadd("bench:lanes:python", "normal:bench")
+    await pipe.execute()
+
+
+async def create_job(conn, script, job_id):
+    args = [job_id, "normal:bench", 3600, 3600, 600]
+    for field, value in job_data(job_id).items():
+        args += [field, value]
+    await script(
+        keys=[f"bench:job:{job_id}", "bench:stream:python:normal:bench", "bench:lanes:python"],
+        args=args
+    )
+
+
+async def run(conn, script, create, jobs, concurrency):
+    remaining = iter(range(jobs))
+
+    async def client():
+        for _ in remaining:
+            await create(conn, script, str(uuid.uuid4()))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return jobs / (time.perf_counter() - start)
+
+
+async def cleanup(conn):
+    async for key in conn.scan_iter(match="bench:*", count=1000):
+        await conn.delete(key)
+
+
+async def main():
+    jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    redis_url = sys.argv[3] if len(sys.argv) > 3 else "redis://localhost:6379"
+
+    conn = Redis.from_url(redis_url, decode_responses=True, max_connections=concurrency)
+    script = conn.register_script(CREATE_JOB)
+
+    try:
+        for name, create in (("sequential", sequential), ("multi", transaction), ("script", create_job)):
+            rate = await run(conn, script, create, jobs, concurrency)
+            print(f"{name:<10} {rate:10.0f} jobs/sec")
+            await cleanup(conn)
+    finally:
+        await conn.aclose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
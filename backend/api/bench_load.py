@@ -0,0 +1,81 @@
+"""
+Load test for the API request path.
+Fires concurrent submissions and result polls and reports requests/sec.
+Run it against a build before and after a change to compare:
+
+    API_URL=http://localhost:8000 API_KEY=... python bench_load.py [concurrency] [seconds]
+
+Rate limits apply as usual, raise them on the server under test or the
+numbers will mostly measure 429 responses.
+"""
+
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+API_URL = os.getenv("API_URL", "http://localhost:8000")
+API_KEY = os.getenv("API_KEY", "")
+
+SUBMISSION = {
+    "code": "print('hello')",
+    "language": "python",
+    "filename": "main.py",
+}
+
+
+async def client_loop(client, deadline, statuses, latencies):
+    """Submit a job, then poll its result, until the deadline"""
+    job_id = None
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        if job_id is None:
+            response = await client.post("/api/submit_code", json=SUBMISSION)
+            if response.status_code == 200:
+                job_id = response.json().get("job_id")
+        else:
+            response = await client.get(f"/api/get_result/{job_id}")
+            if response.status_code == 200 and response.json().get("status") in ("completed", "failed"):
+                job_id = None
+
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status_code] += 1
+
+
+async def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    statuses = Counter()
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(
+        base_url=API_URL,
+        headers={"X-API-Key": API_KEY},
+        limits=limits,
+        timeout=30,
+    ) as client:
+        start = time.perf_counter()
+        deadline = start + seconds
+        await asyncio.gather(*(
+            client_loop(client, deadline, statuses, latencies)
+            for _ in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    total = sum(statuses.values())
+    print(f"{total} requests in {elapsed:.1f}s with {concurrency} clients")
+    print(f"requests/sec: {total / elapsed:.1f}")
+    if latencies:
+        print(f"latency p50 {latencies[len(latencies) // 2] * 1000:.1f} ms"
+              f"  p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+    print(f"status codes: {dict(statuses)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
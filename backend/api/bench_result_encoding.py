@@ -0,0 +1,106 @@
+"""
+Micro-benchmark for the stored job result format.
+Compares the old layout (result json.dumps'd into the job hash, decoded with
+up to two json.loads on read) with the msgpack result record, for encode and
+decode cost and for size. Given a Redis URL it also stores both layouts and
+reports MEMORY USAGE of each job hash:
+
+    python bench_result_encoding.py [iterations] [redis_url]
+"""
+
+import json
+import sys
+import time
+
+import msgpack
+
+# Output sizes of a typical print-heavy submission, a small one and a chatty one
+STDOUT_SIZES = (16, 4096)
+
+
+def sample_result(stdout_size):
+    return {
+        "success": True,
+        "stdout": ("3.14159265358979\n" * (stdout_size // 17 + 1))[:stdout_size],
+        "stderr": "",
+        "exit_code": 0,
+        "execution_time": 0.04213285446166992
+    }
+
+
+def job_info():
+    return {"created_at": "1760000000.123456", "language": "python", "filename": "main.py"}
+
+
+def old_encode(result):
+    return json.dumps(result)
+
+
+def old_decode(result_json):
+    # What the API did on every uncached read
+    parsed = json.loads(result_json)
+    if isinstance(parsed, str) and parsed.startswith("{") and parsed.endswith("}"):
+        parsed = json.loads(parsed)
+    return {"status": "completed", "result": parsed, "error": None, "job_info": job_info()}
+
+
+def record_encode(result):
+    return msgpack.packb({
+        "v": 1,
+        "status": "completed",
+        "result": result,
+        "error": None,
+        "completed_at": 1760000000.5,
+        "job_info": job_info()
+    }, use_bin_type=True)
+
+
+def record_decode(record):
+    return msgpack.unpackb(record, raw=False)
+
+
+def per_call_us(func, arg, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(arg)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def redis_memory(redis_url, result):
+    """MEMORY USAGE of a job hash holding each layout"""
+    import redis
+
+    conn = redis.Redis.from_url(redis_url)
+    base = {"id": "bench", "code": "print(1)", "language": "python", "filename": "main.py",
+            "created_at": "1760000000.123456"}
+    try:
+        conn.hset("bench:old", mapping={**base, "status": "completed", "result": old_encode(result),
+                                         "completed_at": "1760000000.5"})
+        conn.hset("bench:record", mapping={**base, "status": "completed", "record": record_encode(result)})
+        return conn.memory_usage("bench:old"), conn.memory_usage("bench:record")
+    finally:
+        conn.delete("bench:old", "bench:record")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    redis_url = sys.argv[2] if len(sys.argv) > 2 else None
+
+    for size in STDOUT_SIZES:
+        result = sample_result(size)
+        old = old_encode(result)
+        record = record_encode(result)
+
+        print(f"stdout of {size} bytes, {iterations} iterations")
+        print(f"  json:    encode {per_call_us(old_encode, result, iterations):6.2f} us  "
+              f"decode {per_call_us(old_decode, old, iterations):6.2f} us  size {len(old)} B")
+        print(f"  msgpack: encode {per_call_us(record_encode, result, iterations):6.2f} us  "
+              f"decode {per_call_us(record_decode, record, iterations):6.2f} us  size {len(record)} B")
+
+        if redis_url:
+            old_bytes, record_bytes = redis_memory(redis_url, result)
+            print(f"  redis memory per job: json {old_bytes} B, msgpack record {record_bytes} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+Benchmark and equivalence check for the submission security scanner.
+Builds a corpus of ~10KB submissions per language, some clean and some carrying
+blocked keywords or patterns (in mixed case, inside comments and strings, with
+characters IGNORECASE folds onto ASCII letters), then:
+
+  1. checks util/scanner.py gives the same verdict and the same reported
+     keyword/pattern as the previous per-keyword/per-pattern implementation
+     (kept below as reference_scan), exiting non-zero on any difference
+  2. reports the time per submission of both, and of a resubmission served
+     from the verdict cache
+
+    python bench_scanner.py [submissions_per_language] [seed]
+"""
+
+import random
+import re
+import sys
+import time
+
+from models.schema import BLOCKED_KEYWORDS, BLOCKED_PATTERNS
+from util.scanner import scanner
+
+SUBMISSION_SIZE = 10000
+
+CLEAN_LINES = {
+    "python": [
+        "total = sum(value * value for value in range(count))",
+        "def area(radius):\n    return 3.14159 * radius ** 2",
+        "print(f'{name}: {score:.2f}')",
+        "items = sorted(items, key=lambda item: item[1])",
+        "# compute the running average",
+        '"""Docstring with words like mount and eval( inside"""',
+    ],
+    "javascript": [
+        "const total = values.reduce((a, b) => a + b, 0);",
+        "function area(r) { return Math.PI * r * r; }",
+        "console.log(`${name}: ${score}`);",
+        "// sort by score\nitems.sort((a, b) => b.score - a.score);",
+        "/* block comment with fs. and eval( */",
+        "let label = 'process.env is not used here';",
+    ],
+    "c": [
+        "int total = 0;\nfor (int i = 0; i < n; i++) total += i;",
+        "printf(\"%d\\n\", total);",
+        "// sum the array",
+        "/* system( in a comment */",
+        "double area(double r) { return 3.14159 * r * r; }",
+        "char *msg = \"fopen( in a string\";",
+    ],
+    "rust": [
+        "let total: i64 = (0..n).sum();",
+        "fn area(r: f64) -> f64 { 3.14159 * r * r }",
+        "println!(\"{}: {}\", name, score);",
+        "// std::fs:: in a comment",
+        "let v: Vec<i32> = Vec::new();",
+        "let s = \"std::process:: in a string\";",
+    ],
+}
+CLEAN_LINES["typescript"] = CLEAN_LINES["javascript"]
+CLEAN_LINES["cpp"] = CLEAN_LINES["c"]
+CLEAN_LINES["java"] = CLEAN_LINES["c"]
+CLEAN_LINES["go"] = CLEAN_LINES["c"]
+
+# Snippets that trip the patterns, plus near misses
+PATTERN_SNIPPETS = [
+    "import numpy", "eval (x)", "new Function('a')", "\\x41", "\\u0041", "String.fromCharCode (65)",
+    "process . env", "< script >", "exec(cmd)", "system (\"ls\")", "Runtime.exec(cmd)", "kvm_fd",
+    "virtualenv", "/dev/kvm", "remount", "unmount", "Firecracker", "os.popen", "sys . environ",
+    "require('child_process')", "net.connect", "path.join", "crypto.", "vm.run", "process.cwd",
+    "setTimeout(fetch)", "new Worker", "window.atob", "obj['constructor']", "proxy = new Proxy",
+    "Reflect.get", "evalu", "systemd", "execute", "process_env", "moun t",
+]
+
+# Characters re.IGNORECASE matches against ASCII letters
+FOLD_SWAPS = {"s": "ſ", "k": "K", "i": "ı", "I": "İ"}
+
+
+def mutate(token, rng):
+    """Random case changes and occasional folding characters"""
+    chars = []
+    for ch in token:
+        roll = rng.random()
+        if ch in FOLD_SWAPS and roll < 0.1:
+            chars.append(FOLD_SWAPS[ch])
+        elif roll < 0.3:
+            chars.append(ch.swapcase())
+        else:
+            chars.append(ch)
+    return "".join(chars)
+
+
+def make_submission(language, rng):
+    lines = CLEAN_LINES[language]
+    keywords = sorted(set().union(*BLOCKED_KEYWORDS.values()))
+    out = []
+    size = 0
+    dirty = rng.random() < 0.5
+
+    while size < SUBMISSION_SIZE:
+        line = rng.choice(lines)
+        if dirty and rng.random() < 0.01:
+            token = mutate(rng.choice(keywords + PATTERN_SNIPPETS), rng)
+            wrap = rng.choice(["{}", "x = {}", "# {}", "// {}", "'{}'", "\"{}\""])
+            line = wrap.format(token)
+        out.append(line)
+        size += len(line) + 1
+
+    return "\n".join(out)[:SUBMISSION_SIZE]
+
+
+# The implementation the scanner replaced, verbatim apart from returning the detail
+
+def reference_normalize(code, language):
+    if language in ["python"]:
+        code = re.sub(r'#.*$', '', code, flags=re.MULTILINE)
+        code = re.sub(r'""".*?"""', '', code, flags=re.DOTALL)
+        code = re.sub(r"'''.*?'''", '', code, flags=re.DOTALL)
+    elif language in ["javascript", "typescript", "java", "cpp", "c", "go"]:
+        code = re.sub(r'//.*$', '', code, flags=re.MULTILINE)
+        code = re.sub(r'/\*[\s\S]*?\*/', '', code, flags=re.DOTALL)
+
+    code = re.sub(r'"(?:\\.|[^"\\])*"', '""', code)
+    code = re.sub(r"'(?:\\.|[^'\\])*'", "''", code)
+    code = re.sub(r"`(?:\\.|[^`\\])*`", "``", code)
+    return code
+
+
+def reference_scan(code, language):
+    code = reference_normalize(code, language)
+    for keyword in BLOCKED_KEYWORDS[language]:
+        if keyword.lower() in code.lower():
+            return f"Dangerous keyword detected: {keyword}"
+    for pattern in BLOCKED_PATTERNS:
+        if pattern.search(code):
+            return f"Dangerous pattern detected: {pattern.pattern}"
+    return None
+
+
+def per_submission_us(scan, corpus):
+    start = time.perf_counter()
+    for language, code in corpus:
+        scan(code, language)
+    return (time.perf_counter() - start) / len(corpus) * 1e6
+
+
+def main():
+    per_language = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    rng = random.Random(int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+
+    corpus = [
+        (language, make_submission(language, rng))
+        for language in BLOCKED_KEYWORDS
+        for _ in range(per_language)
+    ]
+
+    mismatches = 0
+    rejected = 0
+    for language, code in corpus:
+        expected = reference_scan(code, language)
+        actual = scanner.scan(code, language)
+        rejected += expected is not None
+        if expected != actual:
+            mismatches += 1
+            print(f"MISMATCH ({language}): reference {expected!r}, scanner {actual!r}")
+
+    print(f"{len(corpus)} submissions, {rejected} rejected, {mismatches} mismatches")
+    if mismatches:
+        sys.exit(1)
+
+    print(f"reference: {per_submission_us(reference_scan, corpus):8.1f} us per submission")
+    print(f"scanner:   {per_submission_us(scanner.scan, corpus):8.1f} us per submission")
+
+    for language, code in corpus:
+        scanner.cached_scan(code, language)
+    print(f"cached:    {per_submission_us(scanner.cached_scan, corpus):8.1f} us per resubmission")
+
+
+if __name__ == "__main__":
+    main()
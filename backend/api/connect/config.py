@@ -1,19 +1,29 @@
-from redis import Redis
+from redis.asyncio import Redis, BlockingConnectionPool
+from redis.asyncio.connection import SSLConnection
 import os
 import ssl
 
-def create_redis_connection():
+# Connections for long-polling reads, which hold one for their whole wait
+REDIS_BLOCKING_MAX_CONNECTIONS = int(os.getenv("REDIS_BLOCKING_MAX_CONNECTIONS", "10"))
+
+def create_redis_connection(max_connections: int):
     """
-    Create redis connection for APIs
+    Create async redis connection for APIs.
+    All requests share one pool, so commands from concurrent requests overlap.
     """
-    ssl_context = ssl.create_default_context()
-    
-    return Redis(
+    pool = BlockingConnectionPool(
+        connection_class=SSLConnection,
         host=os.getenv("REDIS_HOST"),
         port=int(os.getenv("REDIS_PORT")),
         password=os.getenv("REDIS_PASS"),
         decode_responses=True,
-        ssl=True,
+        max_connections=max_connections,
+        timeout=5,  # Wait for a free connection before failing
     )
 
-redis_conn = create_redis_connection()
+    return Redis(connection_pool=pool)
+
+redis_conn = create_redis_connection(int(os.getenv("REDIS_MAX_CONNECTIONS", "50")))
+# Blocking XREADs get their own pool, so long-polls can't starve every other
+# request (the rate limiter included) of connections
+blocking_redis_conn = create_redis_connection(REDIS_BLOCKING_MAX_CONNECTIONS)
@@ -16,6 +16,14 @@ async def verify_api_key(api_key: str = Depends(API_KEY_HEADER), request: Reques
         raise HTTPException(status_code=403, detail="Invalid API key")
     return api_key
 
+def api_key_hash(api_key: str) -> str:
+    """Short keyed hash identifying an API key without storing it (rate limits, job lanes)"""
+    return hmac.new(
+        os.getenv("API_KEY", "").encode(),
+        api_key.encode(),
+        "sha256"
+    ).hexdigest()[:16]
+
 def require_api_key(func):
     @wraps(func)
     async def wrapper(*args, **kwargs):
@@ -1,56 +1,157 @@
-from typing import Dict, Set
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from typing import Dict, NamedTuple, Optional
+import math
+import os
 import time
 
-# Store active connection IDs by IP
-connections: Dict[str, Set[str]] = {}
+from util.lru import LRUCache
+from middleware.auth import api_key_hash
 
-# Rate limit settings
-RATE_WINDOW = 60  # seconds
-MAX_CONNECTIONS = 5  # max connections per IP
-MAX_EVENTS = 60  # max events per minute
+class RouteLimit(NamedTuple):
+    """Requests per minute per client IP and per API key, refilled continuously"""
+    ip_per_minute: int
+    key_per_minute: int
 
-# Track event counts by IP
-event_counts: Dict[str, Dict[str, int]] = {}
-last_reset: Dict[str, float] = {}
+# Limits by route group; a group's buckets are separate from every other group's,
+# so polling for results never eats into the submission budget
+ROUTE_LIMITS: Dict[str, RouteLimit] = {
+    "submit": RouteLimit(ip_per_minute=15, key_per_minute=100),
+    "batch": RouteLimit(ip_per_minute=5, key_per_minute=20),
+    "poll": RouteLimit(ip_per_minute=120, key_per_minute=600),
+    "default": RouteLimit(ip_per_minute=15, key_per_minute=100),
+}
 
-async def is_rate_limited(client_ip: str) -> bool:
+# Path prefix -> route group, first match wins
+ROUTE_GROUPS = [
+    ("/api/submit_code", "submit"),
+    ("/api/submit_batch", "batch"),
+    ("/api/get_result", "poll"),
+    ("/api/stream_result", "poll"),
+    ("/api/get_output", "poll"),
+]
+
+# Token buckets for every key in KEYS, checked and charged together.
+# ARGV holds capacity and refill rate (tokens/ms) per key. Buckets are hashes
+# {tokens, ts} stamped with the server clock so every API process agrees.
+# Returns {1, 0, 0} when allowed, else {0, index of the empty bucket (1 based), ms until a token}.
+TOKEN_BUCKET = """
+local now_parts = redis.call('TIME')
+local now = now_parts[1] * 1000 + math.floor(now_parts[2] / 1000)
+local tokens = {}
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local available = tonumber(bucket[1]) or capacity
+    local ts = tonumber(bucket[2]) or now
+
+    available = math.min(capacity, available + math.max(0, now - ts) * rate)
+    if available < 1 then
+        return {0, i, math.ceil((1 - available) / rate)}
+    end
+    tokens[i] = available
+end
+
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i - 1])
+    local rate = tonumber(ARGV[2 * i])
+    redis.call('HSET', key, 'tokens', tostring(tokens[i] - 1), 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate))
+end
+
+return {1, 0, 0}
+"""
+
+# Most clients remembered by the local pre-check
+LOCAL_BLOCK_SIZE = 10000
+# The pre-check can be switched off (RATE_LIMIT_LOCAL_CACHE=0) so every request
+# asks Redis, e.g. when blocks remembered by one replica have gone stale
+LOCAL_CACHE_ENABLED = os.getenv("RATE_LIMIT_LOCAL_CACHE", "1") != "0"
+
+class RateLimiter:
     """
-    Check if client IP is over rate limit
+    Token bucket rate limiting per client IP and per API key, one Redis round
+    trip per request. With local_cache, clients told to back off are
+    remembered locally until their next token is due, and rejected without
+    calling Redis meanwhile.
     """
-    now = time.time()
-    
-    # Reset counter if window expired
-    if client_ip in last_reset and now - last_reset[client_ip] > RATE_WINDOW:
-        if client_ip in event_counts:
-            del event_counts[client_ip]
-    
-    # Check connection count
-    if client_ip in connections and len(connections[client_ip]) >= MAX_CONNECTIONS:
-        return True
-    
-    # Check event count
-    if client_ip in event_counts and event_counts[client_ip].get('events', 0) >= MAX_EVENTS:
-        return True
-    
-    return False
-
-def register_connection(client_ip: str, sid: str) -> None:
-    """Register a new connection from an IP"""
-    if client_ip not in connections:
-        connections[client_ip] = set()
-    
-    connections[client_ip].add(sid)
-    
-    # Initialize event counter
-    if client_ip not in event_counts:
-        event_counts[client_ip] = {'events': 0}
-        last_reset[client_ip] = time.time()
-
-def unregister_connection(client_ip: str, sid: str) -> None:
-    """Remove a connection when client disconnects"""
-    if client_ip in connections and sid in connections[client_ip]:
-        connections[client_ip].remove(sid)
-        
-        # Clean up if no more connections
-        if not connections[client_ip]:
-            del connections[client_ip]
\ No newline at end of file
+
+    def __init__(self, redis_client, local_cache: bool = LOCAL_CACHE_ENABLED):
+        self.redis = redis_client
+        self.script = redis_client.register_script(TOKEN_BUCKET)
+        self.blocked = LRUCache(max_size=LOCAL_BLOCK_SIZE, ttl=60) if local_cache else None
+
+    @staticmethod
+    def route_group(path: str) -> str:
+        for prefix, group in ROUTE_GROUPS:
+            if path.startswith(prefix):
+                return group
+        return "default"
+
+    def buckets(self, request: Request, group: str):
+        """(bucket key, requests per minute, description) for each limit that applies"""
+        limit = ROUTE_LIMITS[group]
+        buckets = [(f"ratelimit:{group}:ip:{request.client.host}", limit.ip_per_minute, "IP")]
+
+        api_key = request.headers.get("X-API-Key")
+        if api_key:
+            # Hash the API key (prevent storage of keys)
+            buckets.append((f"ratelimit:{group}:apikey:{api_key_hash(api_key)}", limit.key_per_minute, "API key"))
+
+        return buckets
+
+    @staticmethod
+    def too_many(description: str, per_minute: int, retry_after: float) -> JSONResponse:
+        return JSONResponse(
+            status_code=429,
+            content={"detail": f"{description} rate limit exceeded: {per_minute} requests per minute"},
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+
+    async def check(self, request: Request) -> Optional[JSONResponse]:
+        """429 response if the request is over a limit, None to let it through"""
+        buckets = self.buckets(request, self.route_group(request.url.path))
+
+        # Local pre-check: no token can be due before the time Redis told us
+        now = time.monotonic()
+        if self.blocked is not None:
+            for key, per_minute, description in buckets:
+                blocked_until = self.blocked.get(key)
+                if blocked_until is not None and blocked_until > now:
+                    return self.too_many(description, per_minute, blocked_until - now)
+
+        args = []
+        for _, per_minute, _ in buckets:
+            args += [per_minute, per_minute / 60000]
+
+        allowed, index, retry_ms = await self.script(keys=[key for key, _, _ in buckets], args=args)
+        if allowed:
+            return None
+
+        key, per_minute, description = buckets[index - 1]
+        if self.blocked is not None:
+            self.blocked.set(key, now + retry_ms / 1000, ttl=retry_ms / 1000)
+        return self.too_many(description, per_minute, retry_ms / 1000)
+
+def add_rate_limit_middleware(app: FastAPI, redis_client):
+    limiter = RateLimiter(redis_client)
+
+    @app.middleware("http")
+    async def rate_limit(request: Request, call_next):
+        """
+        Rate Limiting for IP and API Key.
+        """
+        if request.method == "OPTIONS":
+            return await call_next(request)
+
+        try:
+            response = await limiter.check(request)
+        except Exception as e:
+            print(f"Rate limiting error: {str(e)}")
+            response = None  # In case of Redis errors, allow the request to proceed
+
+        if response is not None:
+            return response
+        return await call_next(request)
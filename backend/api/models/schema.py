@@ -1,5 +1,7 @@
 from pydantic import BaseModel
 from enum import Enum
+from typing import List, Optional
+import os
 import re
 
 class Language(str, Enum):
@@ -12,10 +14,40 @@ class Language(str, Enum):
     GO = "go"
     RUST = "rust"
 
+class Priority(str, Enum):
+    NORMAL = "normal"
+    INTERACTIVE = "interactive"  # A person waiting on the result, weighted above bulk work
+
+class Profile(str, Enum):
+    FAST_COMPILE = "fast-compile"  # Quickest build, unoptimized binary
+    OPTIMIZED = "optimized"  # Slower build, faster binary for CPU heavy runs
+
+# Most test cases one job runs, and the most stdin each of them may carry
+MAX_TEST_CASES = int(os.getenv("MAX_TEST_CASES", "50"))
+MAX_TEST_INPUT_BYTES = int(os.getenv("MAX_TEST_INPUT_BYTES", "65536"))
+
+class TestCase(BaseModel):
+    stdin: str = ""
+    expected_output: Optional[str] = None  # Compared ignoring trailing whitespace
+
 class CodeSubmission(BaseModel):
     code: str 
     language: Language
     filename:str
+    dedup: bool = False  # Reuse the result of an identical recent submission
+    stream: bool = False  # Publish output chunks while the job runs (see /api/get_output)
+    priority: Priority = Priority.NORMAL
+    profile: Profile = Profile.FAST_COMPILE  # Compiled languages only, the others ignore it
+    test_cases: Optional[List[TestCase]] = None  # Compile once, then run once per case
+
+# Most submissions or job ids accepted by one batch call
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "50"))
+
+class BatchSubmission(BaseModel):
+    submissions: List[CodeSubmission]
+
+class BatchResultRequest(BaseModel):
+    job_ids: List[str]
 
 SUPPORTED_LANGUAGES = {
     Language.PYTHON, 
@@ -0,0 +1,137 @@
+import os
+import re
+import string
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from models.schema import BLOCKED_KEYWORDS, BLOCKED_PATTERNS
+from util.lru import LRUCache
+
+# Verdicts of recently scanned submissions, resubmissions skip the scan
+SCAN_CACHE_SIZE = int(os.getenv("SCAN_CACHE_SIZE", "4096"))
+SCAN_CACHE_TTL = 3600
+
+# Every character re.IGNORECASE treats as equal to an ASCII letter, mapped to
+# that letter. Searching folded text case sensitively gives the same matches as
+# an IGNORECASE search of the original, as long as the pattern is ASCII.
+IGNORECASE_FOLD = str.maketrans(
+    string.ascii_uppercase + "\u0130\u0131\u212a\u017f",  # İ ı K(elvin) ſ
+    string.ascii_lowercase + "iiks"
+)
+
+# Pattern text whose meaning changes when lowercased: \S \W \D ... and ranges
+UNFOLDABLE = re.compile(r"\\[A-Z]|\[[^\]]*-")
+
+COMMENT_PATTERNS = {
+    "python": [
+        (re.compile(r'#.*$', re.MULTILINE), ''),
+        (re.compile(r'""".*?"""', re.DOTALL), ''),
+        (re.compile(r"'''.*?'''", re.DOTALL), ''),
+    ],
+    "c_like": [
+        (re.compile(r'//.*$', re.MULTILINE), ''),
+        (re.compile(r'/\*[\s\S]*?\*/', re.DOTALL), ''),
+    ],
+}
+C_LIKE_LANGUAGES = ("javascript", "typescript", "java", "cpp", "c", "go")
+
+STRING_PATTERNS = [
+    (re.compile(r'"(?:\\.|[^"\\])*"'), '""'),   # Double quotes
+    (re.compile(r"'(?:\\.|[^'\\])*'"), "''"),   # Single quotes
+    (re.compile(r"`(?:\\.|[^`\\])*`"), "``"),   # Template literals
+]
+
+class SubmissionScanner:
+    """
+    Security checks for submitted code, compiled once at import.
+
+    Gives the same verdict and reports the same keyword or pattern as checking
+    BLOCKED_KEYWORDS and BLOCKED_PATTERNS one by one, in their iteration order,
+    against code.lower() and the raw code. The code is lowercased and case folded
+    once per submission instead of once per keyword, and IGNORECASE patterns run
+    case sensitively over the folded text, which keeps re's literal prefix search.
+    """
+
+    def __init__(self, keywords: Dict[str, set], patterns: List[re.Pattern]):
+        # Set iteration order is fixed for the life of the process, keep it
+        self.keywords = {
+            language: tuple((keyword, keyword.lower()) for keyword in language_keywords)
+            for language, language_keywords in keywords.items()
+        }
+        self.patterns = [self._fold_pattern(pattern) for pattern in patterns]
+        self.steps = {
+            language: COMMENT_PATTERNS["python"] + STRING_PATTERNS if language == "python"
+            else COMMENT_PATTERNS["c_like"] + STRING_PATTERNS if language in C_LIKE_LANGUAGES
+            else STRING_PATTERNS
+            for language in keywords
+        }
+        self.ruleset_version = self.ruleset_hash(keywords, patterns)
+        self.verdicts = LRUCache(max_size=SCAN_CACHE_SIZE, ttl=SCAN_CACHE_TTL)
+
+    @staticmethod
+    def ruleset_hash(keywords: Dict[str, set], patterns: List[re.Pattern]) -> str:
+        """Short digest of the rules, any edit to keywords or patterns changes it"""
+        rules = [f"{language}\0" + "\0".join(sorted(language_keywords))
+                 for language, language_keywords in sorted(keywords.items())]
+        rules += [f"{pattern.flags}\0{pattern.pattern}" for pattern in patterns]
+        return hashlib.sha256("\n".join(rules).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def _fold_pattern(pattern: re.Pattern) -> Tuple[re.Pattern, re.Pattern, bool]:
+        """(reported pattern, pattern to run, runs on folded text)"""
+        if not pattern.flags & re.IGNORECASE:
+            return pattern, pattern, False
+        if not pattern.pattern.isascii() or UNFOLDABLE.search(pattern.pattern):
+            return pattern, pattern, False
+        folded = re.compile(pattern.pattern.lower(), pattern.flags & ~re.IGNORECASE)
+        return pattern, folded, True
+
+    def normalize(self, code: str, language: str) -> str:
+        """Remove comments and strings (this makes it easier to check for malicious code)"""
+        for regex, replacement in self.steps.get(language, STRING_PATTERNS):
+            code = regex.sub(replacement, code)
+        return code
+
+    def find_keyword(self, code: str, language: str) -> Optional[str]:
+        """First blocked keyword of the language found in code, case insensitive"""
+        lowered = code.lower()
+        for keyword, keyword_lower in self.keywords[language]:
+            if keyword_lower in lowered:
+                return keyword
+        return None
+
+    def find_pattern(self, code: str) -> Optional[re.Pattern]:
+        """First blocked pattern matching code"""
+        folded = code.translate(IGNORECASE_FOLD)
+        for reported, regex, on_folded in self.patterns:
+            if regex.search(folded if on_folded else code):
+                return reported
+        return None
+
+    def scan(self, code: str, language: str) -> Optional[str]:
+        """Reason to reject the submission, or None if it passes"""
+        normalized = self.normalize(code, language)
+
+        keyword = self.find_keyword(normalized, language)
+        if keyword is not None:
+            return f"Dangerous keyword detected: {keyword}"
+
+        pattern = self.find_pattern(normalized)
+        if pattern is not None:
+            return f"Dangerous pattern detected: {pattern.pattern}"
+
+        return None
+
+    def cached_scan(self, code: str, language: str) -> Optional[str]:
+        """scan() behind a cache keyed by language, code hash and ruleset version"""
+        key = (getattr(language, "value", language), hashlib.sha256(code.encode()).digest(), self.ruleset_version)
+
+        # Approvals are cached as "" since the cache returns None for a miss
+        verdict = self.verdicts.get(key)
+        if verdict is None:
+            verdict = self.scan(code, language) or ""
+            self.verdicts.set(key, verdict)
+
+        return verdict or None
+
+scanner = SubmissionScanner(BLOCKED_KEYWORDS, BLOCKED_PATTERNS)
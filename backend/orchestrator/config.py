@@ -1,3 +1,5 @@
+import os
+
 # language to app name MAP
 LANGUAGE_APPS = {
     "python": "codr-python-runner",
@@ -6,3 +8,28 @@ LANGUAGE_APPS = {
     "c": "codr-c-runner",
     "rust": "codr-rust-runner",
 }
+
+# Autoscaling policy per language
+#   min_machines   - machines kept started while jobs are queued
+#   max_machines   - never start more than this
+#   target_backlog - queued jobs one machine is expected to absorb
+DEFAULT_SCALING = {"min_machines": 1, "max_machines": 3, "target_backlog": 10}
+
+SCALING = {
+    "python": {"min_machines": 1, "max_machines": 5, "target_backlog": 20},
+    "javascript": {"min_machines": 1, "max_machines": 3, "target_backlog": 20},
+    "cpp": {"min_machines": 1, "max_machines": 3, "target_backlog": 10},
+    "c": {"min_machines": 1, "max_machines": 3, "target_backlog": 10},
+    "rust": {"min_machines": 1, "max_machines": 3, "target_backlog": 5},
+}
+
+SCALE_UP_COOLDOWN = 30   # seconds between scale ups of the same app
+SCALE_INTERVAL = 15      # seconds between periodic queue checks
+MACHINE_STATE_TTL = 5    # seconds a machine list from the Fly API is reused
+
+# Job lanes: stream:{language}:{lane} listed in lanes:{language}, read by the runners
+# through the consumer group STREAM_GROUP
+STREAM_GROUP = "workers"
+QUEUE_CLAIM_IDLE_MS = int(os.getenv("QUEUE_CLAIM_IDLE_MS", "120000"))  # same as the runners
+STALE_PENDING_SCAN = 100  # most stalled jobs counted per lane
+LANE_REFRESH = 2          # seconds between re-reads of the lane lists
@@ -1,14 +1,15 @@
-from redis import Redis
+from redis.asyncio import Redis
 import os
 import ssl
 import time
+import asyncio
 
 from _logger import logger
-from config import LANGUAGE_APPS
+from config import LANGUAGE_APPS, SCALE_INTERVAL, STREAM_GROUP, QUEUE_CLAIM_IDLE_MS, STALE_PENDING_SCAN, LANE_REFRESH
 
 def create_redis_connection():
     """
-    Create redis connection for APIs
+    Create async redis connection for the orchestrator
     """
     ssl_context = ssl.create_default_context()
     
@@ -23,81 +24,144 @@ def create_redis_connection():
 redis_conn = create_redis_connection()
 
 
-def monitor_queues():
-    """Monitor Redis queues"""
-    from orchestrator import start_runner
+# Scale tasks in flight, referenced so they are not garbage collected
+scale_tasks = set()
+
+def spawn_scale(language, queue_length):
+    """Scale a runner in the background so other languages aren't held up"""
+    from orchestrator import scale_runner
+
+    task = asyncio.create_task(scale_runner(language, queue_length))
+    scale_tasks.add(task)
+    task.add_done_callback(scale_task_done)
+
+def scale_task_done(task):
+    scale_tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Error scaling runner: {task.exception()}")
+
+def lane_stream(language, lane):
+    return f"stream:{language}:{lane}"
+
+async def language_lanes(languages):
+    """Lane streams of each language"""
+    pipe = redis_conn.pipeline()
+    for language in languages:
+        pipe.smembers(f"lanes:{language}")
+    results = await pipe.execute()
+
+    return {
+        language: [lane_stream(language, lane) for lane in sorted(lanes)]
+        for language, lanes in zip(languages, results)
+    }
+
+async def queue_backlogs(languages):
+    """
+    Jobs waiting for a worker per language, summed over its lanes: entries never
+    delivered (acked entries are deleted, so that is length minus pending) plus
+    pending entries whose worker has gone quiet and will be reclaimed.
+    """
+    lanes = await language_lanes(languages)
+
+    pipe = redis_conn.pipeline()
+    for language in languages:
+        for stream in lanes[language]:
+            pipe.xlen(stream)
+            pipe.xpending(stream, STREAM_GROUP)
+            pipe.xpending_range(stream, STREAM_GROUP, min="-", max="+",
+                                count=STALE_PENDING_SCAN, idle=QUEUE_CLAIM_IDLE_MS)
+    # A lane no worker has seen yet has no group, all of it is backlog
+    results = iter(await pipe.execute(raise_on_error=False))
+
+    backlogs = {}
+    for language in languages:
+        backlogs[language] = 0
+        for _ in lanes[language]:
+            length, pending, stale = next(results), next(results), next(results)
+            if isinstance(length, Exception):
+                continue
+            if isinstance(pending, Exception):
+                pending, stale = {"pending": 0}, []
+            backlogs[language] += max(0, length - pending["pending"]) + len(stale)
+    return backlogs
+
+async def latest_entry_ids(streams):
+    """Last entry id of each stream, so XREAD only wakes up for new jobs"""
+    pipe = redis_conn.pipeline()
+    for stream in streams:
+        pipe.xrevrange(stream, count=1)
+    results = await pipe.execute()
+
+    return {
+        stream: entries[0][0] if entries else "0-0"
+        for stream, entries in zip(streams, results)
+    }
+
+async def monitor_queues():
+    """Monitor the job lanes"""
 
     logger.info("Starting queue monitoring")
-    
-    # Create a pubsub object
-    pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
-    pubsub.subscribe("job_notifications")
+
+    lanes = await language_lanes(list(LANGUAGE_APPS))
+    last_ids = await latest_entry_ids([stream for streams in lanes.values() for stream in streams])
     
     # Initial check of queues in case jobs are waiting
-    check_all_queues_once()
-    
-
-    # Health Check vars, Check connectivity (every 5 minutes)
-    last_health_check = time.time()
-    health_check_interval = 300  
+    await check_all_queues_once()
+    last_scale_check = time.time()
     
-    ## Listen for messages ##
-    for message in pubsub.listen():
-        current_time = time.time()
-        
-        # Health check
-        if current_time - last_health_check > health_check_interval:
-            try:
-                # Simple ping to verify redis connection is alive
-                if redis_conn.ping():
-                    logger.debug("Redis connection health check: OK")
-                last_health_check = current_time
-            except Exception as e:
-                logger.error(f"Redis connection health check failed: {str(e)}")
-                # Attempt to reconnect
-                pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
-                pubsub.subscribe("job_notifications")
-       
-        ## Process Job ##
+    ## Wait for new jobs ##
+    while True:
         try:
-            if message and message["type"] == "message":
-
-                 # Decode language name
-                language = message["data"] 
-                
-                # Check if we support this language
-                if language in LANGUAGE_APPS:
-                    app_name = LANGUAGE_APPS[language]
-                    
-                    # Verify there are actually jobs in the queue (for safety)
-                    queue_length = redis_conn.llen(f"queue:{language}")
-                    
-                    if queue_length > 0:
-                        logger.info(f"Received notification of {queue_length} jobs for {language}")
-                        start_runner(app_name)
-                    else:
-                        logger.warning(f"Received notification for {language} but queue is empty")
+            # Lanes come and go with tenants, watch the current ones. Lanes seen
+            # for the first time are read from the start, so their jobs wake us.
+            lanes = await language_lanes(list(LANGUAGE_APPS))
+            streams = {stream: language for language, language_streams in lanes.items() for stream in language_streams}
+            last_ids = {stream: last_ids.get(stream, "0-0") for stream in streams}
 
+            # New entries wake us up straight away; since they stay on the stream
+            # nothing is missed while reconnecting, the periodic check covers the gap
+            if last_ids:
+                response = await redis_conn.xread(last_ids, block=min(SCALE_INTERVAL, LANE_REFRESH) * 1000)
+            else:
+                await asyncio.sleep(LANE_REFRESH)
+                response = None
         except Exception as e:
-            logger.exception(f"Error handling pub/sub message: {str(e)}")
-            logger.exception(f"Error handling pub/sub message: {str(e)}")
+            logger.error(f"Redis stream read error: {str(e)}")
+            response = None
+            await asyncio.sleep(1)
 
-def check_all_queues_once():
-    """Check all queues once at startup"""
-    from orchestrator import start_runner
+        woken = set()
+        for stream, entries in response or []:
+            last_ids[stream] = entries[-1][0]
+            woken.add(streams[stream])
+
+        current_time = time.time()
+
+        # Periodic re-evaluation of every queue
+        if current_time - last_scale_check > SCALE_INTERVAL:
+            await check_all_queues_once()
+            last_scale_check = current_time
+        elif woken:
+            await check_queues(sorted(woken))
+
+async def check_queues(languages):
+    """Scale the runner apps of these languages to their backlog"""
 
     try:
-        # Pipelining for efficiency
-        pipe = redis_conn.pipeline()
-        for language in LANGUAGE_APPS:
-            pipe.llen(f"queue:{language}")
+        backlogs = await queue_backlogs(languages)
         
-        queue_lengths = pipe.execute()
-        
-        for i, (language, app_name) in enumerate(LANGUAGE_APPS.items()):
-            if queue_lengths[i] > 0:
-                logger.info(f"Found {queue_lengths[i]} pending jobs for {language} at startup")
-                start_runner(app_name)
+        for language, backlog in backlogs.items():
+            if backlog > 0:
+                logger.info(f"Found {backlog} pending jobs for {language}")
+                spawn_scale(language, backlog)
                 
     except Exception as e:
-        logger.error(f"Error checking queues at startup: {str(e)}")
+        logger.error(f"Error checking queues: {str(e)}")
+
+async def check_all_queues_once():
+    """Check every queue and scale its runner app to the backlog"""
+    from orchestrator import clean_starting_apps
+
+    # Forget scale-ups whose cooldown is long over, alongside the periodic check
+    clean_starting_apps()
+    await check_queues(list(LANGUAGE_APPS))
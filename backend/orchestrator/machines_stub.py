@@ -0,0 +1,96 @@
+"""
+Local stand-in for the Fly Machines API, for exercising the scaling policy.
+
+    python machines_stub.py [port] [machines_per_app]
+    FLY_API_URL=http://localhost:4280 FLY_API_TOKEN=stub python orchestrator.py
+
+Every runner app starts with all machines stopped. Started machines report
+"starting" for BOOT_DELAY seconds, then "started". GET /state dumps everything.
+"""
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import LANGUAGE_APPS
+
+BOOT_DELAY = 5
+
+machines = {}
+lock = threading.Lock()
+
+
+def machine_state(machine):
+    if machine["state"] == "starting" and time.time() - machine["started_at"] > BOOT_DELAY:
+        machine["state"] = "started"
+    return machine["state"]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+
+        with lock:
+            if parts == ["state"]:
+                return self.send_json(200, {
+                    app: {m["id"]: machine_state(m) for m in app_machines}
+                    for app, app_machines in machines.items()
+                })
+
+            # /v1/apps/{app}/machines
+            if len(parts) == 4 and parts[1] == "apps" and parts[3] == "machines" and parts[2] in machines:
+                return self.send_json(200, [
+                    {"id": m["id"], "state": machine_state(m)} for m in machines[parts[2]]
+                ])
+
+        self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        parts = self.path.strip("/").split("/")
+
+        # /v1/apps/{app}/machines/{id}/start|stop
+        if len(parts) == 6 and parts[1] == "apps" and parts[2] in machines and parts[5] in ("start", "stop"):
+            with lock:
+                for machine in machines[parts[2]]:
+                    if machine["id"] == parts[4]:
+                        if parts[5] == "start":
+                            machine["state"] = "starting"
+                            machine["started_at"] = time.time()
+                        else:
+                            machine["state"] = "stopped"
+                        print(f"{parts[5]} {parts[2]}/{parts[4]}")
+                        return self.send_json(200, {"ok": True})
+
+        self.send_json(404, {"error": "not found"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 4280
+    per_app = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    for app in LANGUAGE_APPS.values():
+        machines[app] = [
+            {"id": f"{app}-{i}", "state": "stopped", "started_at": 0}
+            for i in range(per_app)
+        ]
+
+    print(f"Machines API stub on http://localhost:{port}/v1 ({per_app} machines per app)")
+    ThreadingHTTPServer(("", port), StubHandler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
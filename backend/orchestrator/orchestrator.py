@@ -1,82 +1,107 @@
 import os
 import time
-import requests
-from typing import Dict, List, Tuple
+import asyncio
+import httpx
+from typing import Dict, List, Optional
 
 # Local Imports
 from connect import redis_conn, monitor_queues
 from _logger import logger
-from config import LANGUAGE_APPS
+from config import LANGUAGE_APPS, SCALE_UP_COOLDOWN, MACHINE_STATE_TTL
+from scaling import plan_scale_up, scaling_policy
 
 # Track which apps we've requested to start
 starting_apps = {}
 
+# One scale operation per app at a time
+scale_locks: Dict[str, asyncio.Lock] = {}
+
 class FlyAPIClient:
+    """
+    Async Fly Machines API client.
+    Keeps connections alive between calls and caches each app's machine list
+    for MACHINE_STATE_TTL seconds, so a burst of notifications costs one list call.
+    """
+
     def __init__(self):
         self.api_token = os.getenv("FLY_API_TOKEN")
         if not self.api_token:
             raise ValueError("FLY_API_TOKEN is incorrect or missing.")
-        
-        self.base_url = "https://api.machines.dev/v1"
+
+        # Point FLY_API_URL at machines_stub.py to test scaling locally
+        self.base_url = os.getenv("FLY_API_URL", "https://api.machines.dev/v1")
         self.headers = {
             "Authorization": f"Bearer {self.api_token}",
             "Content-Type": "application/json"
         }
-    
-    def get_app_status(self, app_name: str) -> Dict:
-        """Get app status using REST API"""
-        try:
-            response = requests.get(
-                f"{self.base_url}/apps/{app_name}/machines",
-                headers=self.headers,
-                timeout=30
-            )
-            response.raise_for_status()
-            machines = response.json()
-            
-            return {
-                "name": app_name,
-                "machines": {
-                    "nodes": [
-                        {
-                            "id": machine["id"],
-                            "state": machine["state"]
-                        } for machine in machines
-                    ]
-                }
-            }
-        except requests.RequestException as e:
-            logger.error(f"API request failed: {str(e)}")
-            return None
-    
-    def start_machine(self, app_name: str, machine_id: str) -> bool:
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=self.headers,
+            timeout=httpx.Timeout(10.0, connect=5.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+        self._machines: Dict[str, tuple] = {}
+        self._list_locks: Dict[str, asyncio.Lock] = {}
+
+    async def list_machines(self, app_name: str) -> Optional[List[Dict]]:
+        """Machine ids and states of an app, served from cache while fresh"""
+        lock = self._list_locks.setdefault(app_name, asyncio.Lock())
+
+        # Concurrent callers wait for the in-flight request instead of issuing their own
+        async with lock:
+            cached = self._machines.get(app_name)
+            if cached and time.monotonic() - cached[0] < MACHINE_STATE_TTL:
+                return cached[1]
+
+            try:
+                response = await self.client.get(f"/apps/{app_name}/machines")
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.error(f"API request failed: {str(e)}")
+                return None
+
+            machines = [
+                {
+                    "id": machine["id"],
+                    "state": machine["state"]
+                } for machine in response.json()
+            ]
+            self._machines[app_name] = (time.monotonic(), machines)
+            return machines
+
+    def _set_cached_state(self, app_name: str, machine_id: str, state: str):
+        """Reflect our own start/stop in the cache until the next list call"""
+        cached = self._machines.get(app_name)
+        if cached:
+            for machine in cached[1]:
+                if machine["id"] == machine_id:
+                    machine["state"] = state
+
+    async def start_machine(self, app_name: str, machine_id: str) -> bool:
         """Start a machine using REST API"""
         try:
-            response = requests.post(
-                f"{self.base_url}/apps/{app_name}/machines/{machine_id}/start",
-                headers=self.headers,
-                timeout=30
-            )
+            response = await self.client.post(f"/apps/{app_name}/machines/{machine_id}/start")
             response.raise_for_status()
+            self._set_cached_state(app_name, machine_id, "starting")
             return True
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"API request failed: {str(e)}")
             return False
-    
-    def stop_machine(self, app_name: str, machine_id: str) -> bool:
+
+    async def stop_machine(self, app_name: str, machine_id: str) -> bool:
         """Stop a machine using REST API"""
         try:
-            response = requests.post(
-                f"{self.base_url}/apps/{app_name}/machines/{machine_id}/stop",
-                headers=self.headers,
-                timeout=30
-            )
+            response = await self.client.post(f"/apps/{app_name}/machines/{machine_id}/stop")
             response.raise_for_status()
+            self._set_cached_state(app_name, machine_id, "stopping")
             return True
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"API request failed: {str(e)}")
             return False
 
+    async def close(self):
+        await self.client.aclose()
+
 # Initialize the Fly API client
 try:
     fly_client = FlyAPIClient()
@@ -84,76 +109,77 @@ except ValueError as e:
     logger.error(str(e))
     exit(1)
 
-def start_runner(app_name: str) -> bool:
-    """Start a specific runner app using Fly.io API"""
+async def scale_runner(language: str, backlog: int) -> bool:
+    """Start enough stopped machines of a language's runner app to cover its backlog"""
 
-    current_time = time.time()
-    
-    # Check if attempt to start app recently
-    if app_name in starting_apps:
-        last_start_time = starting_apps[app_name]
-        if current_time - last_start_time < 30:
-            return False
-    
-    # Mark starting of app
-    starting_apps[app_name] = current_time
-    
-    # Get app status
-    logger.info(f"Checking status of {app_name}")
-    app_status = fly_client.get_app_status(app_name)
-    
-    if not app_status:
-        logger.error(f"Failed to get status for {app_name}")
-        return False
-    
-    # Extract machine information
-    machines = app_status.get("machines", {}).get("nodes", [])
-    if not machines:
-        logger.error(f"No machines found for {app_name}")
+    app_name = LANGUAGE_APPS[language]
+    lock = scale_locks.setdefault(app_name, asyncio.Lock())
+
+    # Already scaling this app, the periodic check picks up anything it misses
+    if lock.locked():
         return False
-    
-    # Check machine states
-    running_machines = []
-    stopped_machines = []
-    
-    for machine in machines:
-        if machine["state"] == "started":
-            running_machines.append(machine["id"])
-        elif machine["state"] == "stopped":
-            stopped_machines.append(machine["id"])
-    
-    if running_machines:
-        logger.info(f"App {app_name} already has running machines: {running_machines}")
-        return True
-    
-    # Start a stopped machine if available
-    if stopped_machines:
-        machine_id = stopped_machines[0]
-        logger.info(f"Starting machine {machine_id} for {app_name}")
-        
-        success = fly_client.start_machine(app_name, machine_id)
-        if success:
-            logger.info(f"Successfully started machine {machine_id}")
-            return True
-        else:
-            logger.error(f"Failed to start machine {machine_id}")
+
+    async with lock:
+        current_time = time.time()
+
+        # Give machines started recently time to boot before adding more
+        if app_name in starting_apps:
+            last_start_time = starting_apps[app_name]
+            if current_time - last_start_time < SCALE_UP_COOLDOWN:
+                return False
+
+        # Get app status
+        logger.info(f"Checking status of {app_name} ({backlog} queued jobs)")
+        machines = await fly_client.list_machines(app_name)
+
+        if machines is None:
+            logger.error(f"Failed to get status for {app_name}")
+            return False
+
+        if not machines:
+            logger.error(f"No machines found for {app_name}")
             return False
-    
-    logger.warning(f"No stopped machines available for {app_name}")
-    return False
+
+        to_start = plan_scale_up(backlog, machines, scaling_policy(language))
+        if not to_start:
+            logger.info(f"App {app_name} has enough machines for {backlog} queued jobs")
+            return True
+
+        # Mark scaling of app
+        starting_apps[app_name] = current_time
+
+        logger.info(f"Starting machines {to_start} for {app_name}")
+        results = await asyncio.gather(*(
+            fly_client.start_machine(app_name, machine_id) for machine_id in to_start
+        ))
+
+        for machine_id, success in zip(to_start, results):
+            if success:
+                logger.info(f"Successfully started machine {machine_id}")
+            else:
+                logger.error(f"Failed to start machine {machine_id}")
+
+        return any(results)
 
 def clean_starting_apps():
-    """Remove apps from the starting_apps dict if they were started more than 2 minutes ago"""
+    """Remove apps from the starting_apps dict once their cooldown is long over"""
     current_time = time.time()
     to_remove = []
-    
+
     for app, start_time in starting_apps.items():
-        if current_time - start_time > 120:  # 2 minutes
+        if current_time - start_time > SCALE_UP_COOLDOWN * 4:
             to_remove.append(app)
-    
+
     for app in to_remove:
         del starting_apps[app]
 
+async def main():
+    try:
+        await monitor_queues()
+    finally:
+        await fly_client.close()
+        await redis_conn.aclose()
+
 if __name__ == "__main__":
     logger.info("Orchestrator Starting")
-    monitor_queues()
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,35 @@
+import math
+from typing import Dict, List
+
+from config import SCALING, DEFAULT_SCALING
+
+# Machine states that will be (or already are) pulling jobs
+ACTIVE_STATES = ("started", "starting")
+
+
+def scaling_policy(language: str) -> Dict:
+    return {**DEFAULT_SCALING, **SCALING.get(language, {})}
+
+
+def desired_machines(backlog: int, policy: Dict) -> int:
+    """Number of machines needed for a backlog, within the policy bounds"""
+    if backlog <= 0:
+        return 0
+
+    wanted = math.ceil(backlog / policy["target_backlog"])
+    return max(policy["min_machines"], min(policy["max_machines"], wanted))
+
+
+def plan_scale_up(backlog: int, machines: List[Dict], policy: Dict) -> List[str]:
+    """
+    Pick the stopped machines to start so active machines meet the backlog.
+    Never stops anything, idle workers shut themselves down.
+    """
+    active = [m["id"] for m in machines if m["state"] in ACTIVE_STATES]
+    stopped = [m["id"] for m in machines if m["state"] == "stopped"]
+
+    missing = desired_machines(backlog, policy) - len(active)
+    if missing <= 0:
+        return []
+
+    return stopped[:missing]
@@ -1,17 +1,26 @@
 import subprocess
 import os
-import tempfile
+import time
 import resource
 from firejail import firejail_execute
+from workspace import workspace_pool
+from compile_cache import compile_cache
+from grading import run_test_cases
+from pch import PrecompiledHeaders
+from profiles import COMPILE_PROFILES, profile_flags
 import re
 
-def execute_code(code: str, filename: str):   
+precompiled_headers = {profile: PrecompiledHeaders("c", profile) for profile in COMPILE_PROFILES["c"]}
+
+def execute_code(code: str, filename: str, on_output=None, profile=None, test_cases=None):   
     """
     C Sandbox.
     Create temp directory. Write code to file in dir. Compile and run code in firejail.   
+    With test_cases it is compiled once and run once per case.
+    profile picks the compile flags (fast-compile or optimized).
     """
 
-    with tempfile.TemporaryDirectory() as tmpdir:
+    with workspace_pool.workspace() as tmpdir:
         
         # Check file ext and name
         if not re.match(r'^[a-zA-Z0-9_.-]+$', filename):
@@ -30,25 +39,41 @@ def execute_code(code: str, filename: str):
         
         try:
             # Compile code
-            compile_result = subprocess.run(
-                ["gcc", file_path, "-o", output_path],
-                capture_output=True,
-                text=True,
-                timeout=5
+            profile, flags = profile_flags("c", profile)
+            compile_cmd = ["gcc", *flags, *precompiled_headers[profile].compile_args(code), filename, "-o", "a.out"]
+            start_time = time.time()
+            returncode, compile_stderr, cache_stats = compile_cache.compile(
+                compile_cmd, code, tmpdir, "a.out", timeout=5
             )
+            compile_time = time.time() - start_time
             
             # Failed Compilation
-            if compile_result.returncode != 0:
+            if returncode != 0:
                 return {
                     "success": False,
                     "stdout": "",
-                    "stderr": f"Compilation error:\n{compile_result.stderr}",
-                    "exit_code": compile_result.returncode
+                    "stderr": f"Compilation error:\n{compile_stderr}",
+                    "exit_code": returncode,
+                    "compile_cache": cache_stats,
+                    "profile": profile,
+                    "compile_time": compile_time
                 }
             
             # Set executable permissions & Run in Firejail
             os.chmod(output_path, 0o755)
-            return firejail_execute([output_path], tmpdir)
+            if test_cases:
+                result = run_test_cases(
+                    lambda stdin, output_limit, timeout: firejail_execute(
+                        [output_path], tmpdir, timeout=timeout, on_output=on_output, stdin=stdin, output_limit=output_limit
+                    ),
+                    test_cases
+                )
+            else:
+                result = firejail_execute([output_path], tmpdir, on_output=on_output)
+            result["compile_time"] = compile_time
+            result["profile"] = profile
+            result["compile_cache"] = cache_stats
+            return result
             
         except subprocess.TimeoutExpired:
             return {
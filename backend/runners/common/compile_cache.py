@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from firejail import hide_from_sandbox
+
+# Outside the temp dir and blacklisted in the sandbox, cached binaries are run by later jobs
+CACHE_DIR = os.getenv("COMPILE_CACHE_DIR", "/var/cache/codr-compile-cache")
+CACHE_MAX_BYTES = int(os.getenv("COMPILE_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class CompileCache:
+    """
+    Content addressed cache of compiler output on local disk.
+    Entries are keyed by (source, compiler version, command line) and hold
+    either the produced binary, with its sha256 checked on every hit, or the
+    compile error. Least recently used entries are evicted once the cache
+    grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        hide_from_sandbox(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.saved_time = 0.0
+        self._size = None
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def compiler_version(self, compiler: str) -> str:
+        """First line of `compiler --version`, looked up once per compiler"""
+        if compiler not in self._versions:
+            try:
+                result = subprocess.run(
+                    [compiler, "--version"],
+                    capture_output=True,
+                    text=True,
+                    timeout=5
+                )
+                self._versions[compiler] = result.stdout.split("\n", 1)[0]
+            except (OSError, subprocess.TimeoutExpired):
+                self._versions[compiler] = "unknown"
+        return self._versions[compiler]
+
+    def key(self, compile_cmd, source: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(self.compiler_version(compile_cmd[0]).encode())
+        digest.update(b"\0")
+        digest.update("\0".join(compile_cmd).encode())
+        digest.update(b"\0")
+        digest.update(source.encode())
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _entry_size(self, path: str) -> int:
+        total = 0
+        for name in os.listdir(path):
+            total += os.path.getsize(os.path.join(path, name))
+        return total
+
+    def _entries(self):
+        """All cache entries as (mtime, path)"""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for prefix in os.listdir(self.cache_dir):
+            prefix_path = os.path.join(self.cache_dir, prefix)
+            if len(prefix) != 2 or not os.path.isdir(prefix_path):
+                continue
+            for key in os.listdir(prefix_path):
+                path = os.path.join(prefix_path, key)
+                entries.append((os.path.getmtime(path), path))
+        return entries
+
+    def _current_size(self) -> int:
+        """Total cache size, scanned from disk once and then tracked in memory"""
+        if self._size is None:
+            self._size = sum(self._entry_size(path) for _, path in self._entries())
+        return self._size
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is under 90% of its budget"""
+        target = self.max_bytes * 0.9
+        for _, path in sorted(self._entries()):
+            if self._size <= target:
+                break
+            try:
+                size = self._entry_size(path)
+                shutil.rmtree(path)
+                self._size -= size
+            except OSError:
+                pass
+
+    def _remove(self, path: str):
+        with self._lock:
+            try:
+                size = self._entry_size(path)
+                shutil.rmtree(path)
+            except OSError:
+                return
+            if self._size is not None:
+                self._size -= size
+
+    def lookup(self, key: str):
+        """Return the entry's metadata, or None on a miss"""
+        path = self._entry_path(key)
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+            # Mark as recently used
+            os.utime(path)
+            return meta
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def store(self, key: str, meta: dict, binary_path: str = None):
+        """Atomically add an entry, a concurrent store of the same key wins"""
+        path = self._entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        staging = tempfile.mkdtemp(dir=os.path.dirname(path))
+
+        try:
+            if binary_path:
+                shutil.copy2(binary_path, os.path.join(staging, "binary"))
+                meta = {**meta, "sha256": file_digest(os.path.join(staging, "binary"))}
+            with open(os.path.join(staging, "meta.json"), "w") as f:
+                json.dump(meta, f)
+
+            size = self._entry_size(staging)
+            os.rename(staging, path)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+
+        with self._lock:
+            self._size = self._current_size() + size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def compile(self, compile_cmd, source: str, workdir: str, output: str, timeout: int):
+        """
+        Run compile_cmd in workdir unless an identical build is cached.
+        Returns (returncode, stderr, stats). On success workdir/output holds the binary.
+        Timeouts are raised to the caller and never cached.
+        """
+        key = self.key(compile_cmd, source)
+        output_path = os.path.join(workdir, output)
+        meta = self.lookup(key)
+
+        if meta is not None:
+            binary = os.path.join(self._entry_path(key), "binary")
+            try:
+                if meta["returncode"] == 0:
+                    # Check the copy the job will run, not the entry, which could change in between
+                    shutil.copy2(binary, output_path)
+                    if file_digest(output_path) != meta.get("sha256"):
+                        raise ValueError("binary does not match its digest")
+                with self._lock:
+                    self.hits += 1
+                    self.saved_time += meta["compile_time"]
+                return meta["returncode"], meta["stderr"], self._stats(True, meta["compile_time"])
+            except OSError:
+                # Entry evicted under us, compile normally
+                pass
+            except ValueError as e:
+                print(f"Dropping compile cache entry {key}: {e}")
+                self._remove(self._entry_path(key))
+
+        start_time = time.time()
+        compile_result = subprocess.run(
+            compile_cmd,
+            cwd=workdir,
+            capture_output=True,
+            text=True,
+            timeout=timeout
+        )
+        compile_time = time.time() - start_time
+
+        meta = {
+            "returncode": compile_result.returncode,
+            "stderr": compile_result.stderr,
+            "compile_time": compile_time
+        }
+        try:
+            self.store(key, meta, output_path if compile_result.returncode == 0 else None)
+        except OSError as e:
+            print(f"Compile cache store failed: {e}")
+
+        with self._lock:
+            self.misses += 1
+        return compile_result.returncode, compile_result.stderr, self._stats(False, 0.0)
+
+    def _stats(self, hit: bool, saved: float) -> dict:
+        with self._lock:
+            return {
+                "hit": hit,
+                "hits": self.hits,
+                "misses": self.misses,
+                "saved_compile_time": saved,
+                "total_saved_compile_time": self.saved_time
+            }
+
+
+compile_cache = CompileCache(CACHE_DIR, CACHE_MAX_BYTES)
@@ -1,10 +1,43 @@
 import subprocess
 import os
 import tempfile
+import codecs
+import select
+import shutil
+import statistics
+import threading
+import time
 
-def firejail_execute(cmd, tmpdir, timeout=10):
+# Per-process resource limits applied to sandboxed code
+RLIMIT_AS = 300000000       # 300MB memory limit
+RLIMIT_CPU = 5              # 5 second CPU limit
+RLIMIT_FSIZE = 1000000      # 1MB file size limit
+
+# Bytes of stdout and of stderr captured per run. A program writing more is
+# stopped, so output held by the worker and stored in Redis stays bounded.
+OUTPUT_LIMIT_BYTES = int(os.getenv("OUTPUT_LIMIT_BYTES", str(1024 * 1024)))
+READ_SIZE = 65536
+
+# Runs of an empty program used to measure firejail's startup time
+STARTUP_CALIBRATION_RUNS = 5
+
+# Host directories blacklisted in every sandbox, registered by the modules that
+# own them. Jobs could otherwise rewrite what later jobs are built from.
+BLACKLIST = []
+
+
+def hide_from_sandbox(path):
+    """Make path invisible to sandboxes started from now on"""
+    path = os.path.abspath(path)
+    if path not in BLACKLIST:
+        BLACKLIST.append(path)
+
+
+def firejail_command(cmd, tmpdir, timeout=None, rlimits=True):
     """
-    Execute a command in a Firejail sandbox with security restrictions.
+    Build the firejail command line for running cmd inside tmpdir.
+    Long lived sandboxes (the python zygote) skip rlimits and the timeout
+    and apply the limits to each forked job themselves.
     """
 
     firejail_cmd = [
@@ -15,30 +48,217 @@ def firejail_execute(cmd, tmpdir, timeout=10):
         "--net=none",                           # No network access
         "--nodbus",                             # No D-Bus
         "--noroot",                             # No root privileges
-        "--rlimit-as=300000000",                # 300MB memory limit
-        "--rlimit-cpu=5",                       # 5 second CPU limit
-        "--rlimit-fsize=1000000",               # 1MB file size limit
-        "--timeout=00:00:{:02d}".format(timeout),
-    ] + cmd
-    
+    ]
+    firejail_cmd += ["--blacklist=" + path for path in BLACKLIST]
+
+    if rlimits:
+        firejail_cmd += [
+            "--rlimit-as={}".format(RLIMIT_AS),
+            "--rlimit-cpu={}".format(RLIMIT_CPU),
+            "--rlimit-fsize={}".format(RLIMIT_FSIZE),
+        ]
+
+    if timeout is not None:
+        firejail_cmd.append("--timeout=00:00:{:02d}".format(timeout))
+
+    return firejail_cmd + cmd
+
+
+_startup_time = None
+_startup_lock = threading.Lock()
+
+
+def sandbox_startup_time():
+    """
+    Seconds firejail takes to set up a sandbox before the program starts, the
+    median wall time of running `true` in one. Measured once per process.
+    """
+    global _startup_time
+    with _startup_lock:
+        if _startup_time is None:
+            tmpdir = tempfile.mkdtemp()
+            samples = []
+            try:
+                for _ in range(STARTUP_CALIBRATION_RUNS):
+                    start_time = time.time()
+                    subprocess.run(firejail_command(["true"], tmpdir, timeout=5), capture_output=True, timeout=10)
+                    samples.append(time.time() - start_time)
+                _startup_time = statistics.median(samples)
+                print(f"Sandbox startup calibrated at {_startup_time * 1000:.1f}ms")
+            except (OSError, subprocess.TimeoutExpired) as e:
+                print(f"Sandbox startup calibration failed: {e}")
+                _startup_time = 0.0
+            finally:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+        return _startup_time
+
+
+def run_usage(wall_time, startup_time, user_time=None, sys_time=None, max_rss=None):
+    """
+    Timing and resource fields of a run's result. run_time is the wall time
+    less the sandbox's startup. CPU times and peak RSS (bytes) cover the whole
+    sandbox, None when they couldn't be collected.
+    """
+    return {
+        "sandbox_startup_time": min(startup_time, wall_time),
+        "run_time": max(0.0, wall_time - startup_time),
+        "cpu_user_time": user_time,
+        "cpu_sys_time": sys_time,
+        "max_rss_bytes": max_rss
+    }
+
+
+class OutputBuffer:
+    """
+    The first `limit` bytes of an output stream, decoded as UTF-8.
+    Bytes past the limit are dropped and mark the buffer truncated.
+    """
+
+    def __init__(self, limit=OUTPUT_LIMIT_BYTES):
+        self.limit = limit
+        self.size = 0
+        self.truncated = False
+        self._decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        self._parts = []
+
+    def append(self, chunk: bytes) -> str:
+        """Add a raw chunk, returns the decoded part of it that was kept"""
+        if self.truncated:
+            return ""
+        if self.size + len(chunk) > self.limit:
+            chunk = chunk[:self.limit - self.size]
+            self.truncated = True
+
+        self.size += len(chunk)
+        data = self._decoder.decode(chunk, final=self.truncated)
+        if data:
+            self._parts.append(data)
+        return data
+
+    def close(self) -> str:
+        """Flush a trailing partial character, returns what it decoded to"""
+        data = self._decoder.decode(b"", final=True)
+        if data:
+            self._parts.append(data)
+        return data
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+
+def stream_process(proc, timeout, on_output=None, output_limit=OUTPUT_LIMIT_BYTES):
+    """
+    Read proc's stdout/stderr incrementally into bounded buffers until exit or
+    timeout, passing each decoded chunk to on_output(stream, data) if given.
+    The process is killed once either stream passes output_limit bytes.
+    Returns (stdout buffer, stderr buffer, timed_out, rusage). The rusage from
+    wait4 includes the descendants the process reaped, None if unavailable.
+    """
+    streams = {
+        proc.stdout.fileno(): ("stdout", OutputBuffer(output_limit)),
+        proc.stderr.fileno(): ("stderr", OutputBuffer(output_limit)),
+    }
+    buffers = dict(streams.values())
+    deadline = time.monotonic() + timeout
+    timed_out = False
+
+    while streams:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            timed_out = True
+            proc.kill()
+            break
+
+        ready, _, _ = select.select(list(streams), [], [], remaining)
+        for fd in ready:
+            name, buffer = streams[fd]
+            chunk = os.read(fd, READ_SIZE)
+            data = buffer.append(chunk) if chunk else buffer.close()
+            if data and on_output is not None:
+                on_output(name, data)
+            if not chunk:
+                del streams[fd]
+            elif buffer.truncated:
+                # Stop the program instead of draining output nobody keeps
+                proc.kill()
+                streams.clear()
+                break
+
+    proc.stdout.close()
+    proc.stderr.close()
+    try:
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    except ChildProcessError:
+        rusage = None
+        proc.wait()
+    return buffers["stdout"], buffers["stderr"], timed_out, rusage
+
+
+def feed_stdin(pipe, data):
+    """Write data to a process's stdin and close it, the process may exit without reading it all"""
     try:
-        result = subprocess.run(
-            firejail_cmd,
-            capture_output=True,
-            text=True,
-            timeout=timeout + 2  # Extra time for firejail overhead
-        )
-        
-        return {
-            "success": result.returncode == 0,
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "exit_code": result.returncode
-        }
-    except subprocess.TimeoutExpired:
-        return {
-            "success": False,
-            "stdout": "",
-            "stderr": f"Execution timed out ({timeout} seconds)",
-            "exit_code": -1
-        }
+        pipe.write(data)
+    except (BrokenPipeError, OSError):
+        pass
+    finally:
+        try:
+            pipe.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+
+def output_result(stdout, stderr, exit_code, timeout, timed_out):
+    """Result of a sandboxed run from its output buffers, noting why it was stopped"""
+    stderr_text = stderr.text
+    if timed_out:
+        stderr_text += f"Execution timed out ({timeout} seconds)"
+        exit_code = -1
+    elif stdout.truncated or stderr.truncated:
+        stderr_text += f"Output limit exceeded ({stdout.limit} bytes), execution stopped"
+        exit_code = -1
+
+    return {
+        "success": exit_code == 0,
+        "stdout": stdout.text,
+        "stderr": stderr_text,
+        "exit_code": exit_code,
+        "stdout_truncated": stdout.truncated,
+        "stderr_truncated": stderr.truncated
+    }
+
+
+def firejail_execute(cmd, tmpdir, timeout=10, on_output=None, stdin=None, output_limit=OUTPUT_LIMIT_BYTES):
+    """
+    Execute a command in a Firejail sandbox with security restrictions.
+    Output is read as it is produced, passed on to on_output if given, and
+    kept up to output_limit bytes per stream; a run writing more is stopped.
+    stdin is text fed to the command's standard input.
+    """
+
+    firejail_cmd = firejail_command(cmd, tmpdir, timeout)
+
+    start_time = time.time()
+    proc = subprocess.Popen(
+        firejail_cmd,
+        stdin=subprocess.PIPE if stdin is not None else None,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE
+    )
+    if stdin is not None:
+        # Fed from a thread so a program writing before it reads can't deadlock us
+        threading.Thread(target=feed_stdin, args=(proc.stdin, stdin.encode()), daemon=True).start()
+
+    # Extra time for firejail overhead
+    stdout, stderr, timed_out, rusage = stream_process(proc, timeout + 2, on_output, output_limit)
+    wall_time = time.time() - start_time
+
+    result = output_result(stdout, stderr, proc.returncode, timeout, timed_out)
+    if rusage is not None:
+        result.update(run_usage(
+            wall_time, sandbox_startup_time(), rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss * 1024
+        ))
+    else:
+        result.update(run_usage(wall_time, sandbox_startup_time()))
+    return result
@@ -0,0 +1,112 @@
+import json
+import os
+import time
+
+from firejail import OUTPUT_LIMIT_BYTES
+
+# Output kept per case never drops below this, however many cases a job has
+MIN_CASE_OUTPUT_BYTES = 16384
+# Timeout of a single case, same as a plain run
+CASE_TIMEOUT = 10
+# Wall time all of a job's cases get together. Kept well below the queue's
+# claim idle time (QUEUE_CLAIM_IDLE_MS), a job still running past that is
+# handed to another worker and run twice.
+JOB_DEADLINE = int(os.getenv("JOB_DEADLINE", "60"))
+if JOB_DEADLINE < 1:
+    raise ValueError(f"JOB_DEADLINE must be at least 1 second, got {JOB_DEADLINE}")
+
+
+def parse_test_cases(raw):
+    """Test cases stored on the job hash as JSON, None for a plain run"""
+    if not raw:
+        return None
+    return [
+        {"stdin": case.get("stdin") or "", "expected_output": case.get("expected_output")}
+        for case in json.loads(raw)
+    ]
+
+
+def outputs_match(actual: str, expected: str) -> bool:
+    """Same output ignoring trailing whitespace on each line and trailing blank lines"""
+    def lines(text):
+        return [line.rstrip() for line in text.rstrip().splitlines()]
+    return lines(actual) == lines(expected)
+
+
+def skipped_case(timeout):
+    """Result of a case that never ran because the job hit its deadline"""
+    return {
+        "success": False,
+        "stdout": "",
+        "stderr": f"Not run, the test cases exceeded the job's time limit ({timeout} seconds)",
+        "exit_code": -1,
+        "skipped": True
+    }
+
+
+def total_usage(cases):
+    """Timings and CPU times summed over the cases that ran, the peak RSS of the largest"""
+    cases = [case for case in cases if not case.get("skipped")]
+
+    def total(field):
+        values = [case.get(field) for case in cases]
+        return None if None in values else sum(values)
+
+    peaks = [case.get("max_rss_bytes") for case in cases]
+    return {
+        "sandbox_startup_time": total("sandbox_startup_time"),
+        "run_time": total("run_time"),
+        "cpu_user_time": total("cpu_user_time"),
+        "cpu_sys_time": total("cpu_sys_time"),
+        "max_rss_bytes": None if None in peaks or not peaks else max(peaks)
+    }
+
+
+def run_test_cases(run, test_cases):
+    """
+    Run a program once per test case. run(stdin, output_limit, timeout)
+    executes it in a fresh sandbox with the usual limits and returns its
+    result, so every case gets its own timeout and rlimits. Cases share the
+    workspace, the program is built once. The job's output budget is split
+    between the cases and all of them must finish within JOB_DEADLINE: a case
+    gets at most the time left, cases past the deadline are skipped.
+    """
+    output_limit = max(OUTPUT_LIMIT_BYTES // len(test_cases), MIN_CASE_OUTPUT_BYTES)
+    deadline = time.monotonic() + JOB_DEADLINE
+
+    cases = []
+    for case in test_cases:
+        # Whole seconds, firejail's --timeout has no finer resolution
+        remaining = int(deadline - time.monotonic())
+        if remaining < 1:
+            result = skipped_case(JOB_DEADLINE)
+        else:
+            result = run(case["stdin"], output_limit, min(CASE_TIMEOUT, remaining))
+        if case["expected_output"] is not None:
+            result["passed"] = result["success"] and outputs_match(result["stdout"], case["expected_output"])
+        cases.append(result)
+
+    graded = [case for case in cases if "passed" in case]
+    passed = sum(case["passed"] for case in graded)
+    skipped = sum(case.get("skipped", False) for case in cases)
+    failed_exit = next((case["exit_code"] for case in cases if case["exit_code"] != 0), 0)
+
+    if graded:
+        summary = f"{passed}/{len(graded)} test cases passed"
+    else:
+        summary = f"Ran {len(cases)} test cases"
+    if skipped:
+        summary += f", {skipped} not run in time"
+
+    return {
+        "success": all(case["success"] and case.get("passed", True) for case in cases),
+        "stdout": summary,
+        "stderr": "",
+        "exit_code": failed_exit,
+        "test_cases": cases,
+        "passed": passed,
+        "graded": len(graded),
+        "total": len(cases),
+        "skipped": skipped,
+        **total_usage(cases)
+    }
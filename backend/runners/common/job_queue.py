@@ -0,0 +1,214 @@
+import os
+import time
+import socket
+import redis
+from collections import deque
+
+# A language's jobs are entries {"job_id": ...} on lane streams
+# stream:{language}:{priority}:{api key hash}, listed in the set lanes:{language}.
+# Each lane is read through a consumer group shared by every worker of the
+# language. An entry stays pending until the worker that read it acks it, so a
+# job whose worker died is reclaimed by another worker once it has been idle
+# for CLAIM_IDLE_MS.
+GROUP = "workers"
+CLAIM_IDLE_MS = int(os.getenv("QUEUE_CLAIM_IDLE_MS", "120000"))
+MAX_DELIVERIES = int(os.getenv("QUEUE_MAX_DELIVERIES", "3"))
+CLAIM_BATCH = 10
+
+# Jobs a lane may take per round robin turn, by priority class
+LANE_WEIGHTS = {
+    "interactive": int(os.getenv("INTERACTIVE_WEIGHT", "4")),
+    "normal": 1,
+}
+LANE_REFRESH = 1  # seconds the lane list is reused
+
+# Drop a lane from the set once its stream holds nothing, not even pending jobs.
+# Atomic with the API's XADD + SADD, so a lane with work is never dropped.
+PRUNE_LANE = """
+if redis.call('XLEN', KEYS[2]) == 0 then
+    return redis.call('SREM', KEYS[1], ARGV[1])
+end
+return 0
+"""
+
+def lanes_key(language):
+    return f"lanes:{language}"
+
+def lane_stream(language, lane):
+    return f"stream:{language}:{lane}"
+
+def lane_weight(lane):
+    return LANE_WEIGHTS.get(lane.split(":", 1)[0], 1)
+
+def consumer_name():
+    """Unique per worker process, stable for its lifetime"""
+    return f"{os.getenv('FLY_MACHINE_ID', socket.gethostname())}-{os.getpid()}"
+
+class JobQueue:
+    """
+    Worker side of a language's job lanes.
+    read() and reclaim() hand out (stream, entry_id, job_id), ack() each once it is done.
+
+    Lanes are served by deficit round robin: on its turn a lane may hand out up to
+    its weight in jobs, empty lanes lose their turn. With every tenant in its own
+    lane, a light user waits behind at most one turn of each active lane however
+    many jobs a bulk submitter has queued.
+    """
+
+    def __init__(self, redis_conn, language, consumer=None):
+        self.redis_conn = redis_conn
+        self.language = language
+        self.consumer = consumer or consumer_name()
+        self.prune_lane = redis_conn.register_script(PRUNE_LANE)
+
+        self._lanes = []
+        self._lanes_read_at = 0
+        self._groups = set()
+        self._turn = 0
+        self._deficits = {}
+        # Entries a multi-lane blocking read delivered beyond the one it needed
+        self._ready = deque()
+
+    def ensure_group(self, stream):
+        """Create the consumer group (and stream) if missing, starting from the oldest entry"""
+        try:
+            self.redis_conn.xgroup_create(stream, GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._groups.add(stream)
+
+    def lanes(self, refresh=False):
+        """Lane names of the language, re-read every LANE_REFRESH seconds"""
+        if refresh or time.time() - self._lanes_read_at > LANE_REFRESH:
+            self._lanes = sorted(self.redis_conn.smembers(lanes_key(self.language)))
+            self._lanes_read_at = time.time()
+            for lane in self._lanes:
+                if lane_stream(self.language, lane) not in self._groups:
+                    self.ensure_group(lane_stream(self.language, lane))
+        return self._lanes
+
+    def migrate_legacy_queue(self):
+        """Move job ids left on the old queue:{language} list onto a lane"""
+        lane = "normal:legacy"
+        moved = 0
+        while True:
+            job_id = self.redis_conn.rpop(f"queue:{self.language}")
+            if job_id is None:
+                break
+            pipe = self.redis_conn.pipeline()
+            pipe.xadd(lane_stream(self.language, lane), {"job_id": job_id})
+            pipe.sadd(lanes_key(self.language), lane)
+            pipe.execute()
+            moved += 1
+
+        if moved:
+            print(f"Moved {moved} jobs from queue:{self.language} to lane {lane}")
+
+    def _read_group(self, streams, block_ms=None):
+        """XREADGROUP of new entries, recreating groups of lane streams that expired"""
+        try:
+            return self.redis_conn.xreadgroup(GROUP, self.consumer, streams, count=1, block=block_ms)
+        except redis.ResponseError as e:
+            if "NOGROUP" not in str(e):
+                raise
+            for stream in streams:
+                self.ensure_group(stream)
+            return self.redis_conn.xreadgroup(GROUP, self.consumer, streams, count=1, block=block_ms)
+
+    def _read_lane(self, lane):
+        stream = lane_stream(self.language, lane)
+        for _, entries in self._read_group({stream: ">"}) or []:
+            for entry_id, fields in entries:
+                return stream, entry_id, fields.get("job_id")
+
+        # Nothing new, forget the lane if its stream is completely drained
+        self.prune_lane(keys=[lanes_key(self.language), stream], args=[lane])
+        return None
+
+    def read(self, block_ms):
+        """Next job by deficit round robin over the lanes, waiting up to block_ms. None on timeout"""
+        if self._ready:
+            return self._ready.popleft()
+
+        lanes = self.lanes()
+        for _ in range(len(lanes)):
+            lane = lanes[self._turn % len(lanes)]
+
+            # A lane starting its turn gets its weight in credit
+            if self._deficits.get(lane, 0) <= 0:
+                self._deficits[lane] = lane_weight(lane)
+
+            job = self._read_lane(lane)
+            if job:
+                self._deficits[lane] -= 1
+                if self._deficits[lane] <= 0:
+                    self._turn += 1
+                return job
+
+            # Empty lanes don't keep credit
+            self._deficits.pop(lane, None)
+            self._turn += 1
+
+        # Everything drained: block on all lanes at once for the next job
+        lanes = self.lanes(refresh=True)
+        if not lanes:
+            time.sleep(min(block_ms / 1000, LANE_REFRESH))
+            return None
+
+        response = self._read_group(
+            {lane_stream(self.language, lane): ">" for lane in lanes}, block_ms=block_ms
+        )
+        for stream, entries in response or []:
+            for entry_id, fields in entries:
+                self._ready.append((stream, entry_id, fields.get("job_id")))
+
+        return self._ready.popleft() if self._ready else None
+
+    def ack(self, stream, entry_id):
+        """Mark a job done and drop its entry so the stream only holds live work"""
+        pipe = self.redis_conn.pipeline()
+        pipe.xack(stream, GROUP, entry_id)
+        pipe.xdel(stream, entry_id)
+        pipe.execute()
+
+    def reclaim(self, count, on_dead_letter):
+        """
+        Take over up to `count` jobs left pending by dead workers, from any lane.
+        Jobs already delivered MAX_DELIVERIES times are handed to on_dead_letter(job_id)
+        and acked instead of being run again.
+        """
+        jobs = []
+        for lane in self.lanes():
+            if len(jobs) >= count:
+                break
+            jobs += self._reclaim_stream(lane_stream(self.language, lane), count - len(jobs), on_dead_letter)
+        return jobs
+
+    def _reclaim_stream(self, stream, count, on_dead_letter):
+        stale = self.redis_conn.xpending_range(
+            stream, GROUP, min="-", max="+", count=min(count, CLAIM_BATCH), idle=CLAIM_IDLE_MS
+        )
+        if not stale:
+            return []
+
+        # XCLAIM re-checks the idle time, so only one worker wins each entry
+        claimed = self.redis_conn.xclaim(
+            stream, GROUP, self.consumer, CLAIM_IDLE_MS, [entry["message_id"] for entry in stale]
+        )
+        deliveries = {entry["message_id"]: entry["times_delivered"] for entry in stale}
+
+        jobs = []
+        for entry_id, fields in claimed:
+            # Entries deleted after being read come back without fields
+            job_id = (fields or {}).get("job_id")
+            if not job_id:
+                self.ack(stream, entry_id)
+            elif deliveries.get(entry_id, 0) >= MAX_DELIVERIES:
+                print(f"Job {job_id} was delivered {deliveries[entry_id]} times, giving up")
+                on_dead_letter(job_id)
+                self.ack(stream, entry_id)
+            else:
+                print(f"Reclaimed job {job_id} from a stalled worker")
+                jobs.append((stream, entry_id, job_id))
+        return jobs
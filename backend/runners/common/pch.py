@@ -0,0 +1,245 @@
+"""
+Precompiled standard headers for the C and C++ runners.
+
+Each header set gets a wrapper header in PCH_DIR including it, compiled to
+<name>.h.gch with the runner's own compile flags. A submission whose leading
+#include lines start with one of the sets is compiled with `-include <name>.h`:
+gcc loads the .gch instead of parsing the headers, and the submission's own
+#includes of them become no-ops behind their include guards. Since the forced
+headers are the ones the submission includes first anyway, in the same order,
+it compiles exactly as before.
+
+A .gch only loads with the flags it was built with, so every compile profile
+has its own headers. The runner images build them (python pch.py <language>),
+workers check them before the first compile and rebuild any made by another
+compiler or with other flags. PCH_DIR is blacklisted in the sandbox and each
+.gch is checked against the sha256 recorded when it was built before use.
+
+    python pch.py cpp
+"""
+
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+from compile_cache import file_digest
+from firejail import hide_from_sandbox
+from profiles import COMPILE_PROFILES, DEFAULT_PROFILE
+
+PCH_DIR = os.getenv("PCH_DIR", "/opt/codr-pch")
+PCH_ENABLED = os.getenv("PCH", "1") != "0"
+PCH_BUILD_TIMEOUT = 120
+
+# (compiler, flags the sandbox's compile command starts with, header sets by name).
+# The profile's flags from COMPILE_PROFILES come after them.
+PCH_TOOLCHAINS = {
+    "cpp": ("g++", ["-std=c++11"], {
+        "stdcxx": ["bits/stdc++.h"],
+        "iostream": ["iostream"],
+        "iostream_vector": ["iostream", "vector"],
+        "iostream_string": ["iostream", "string"],
+        "iostream_vector_algorithm": ["iostream", "vector", "algorithm"],
+    }),
+    "c": ("gcc", [], {
+        "stdio": ["stdio.h"],
+        "stdio_stdlib": ["stdio.h", "stdlib.h"],
+        "stdio_stdlib_string": ["stdio.h", "stdlib.h", "string.h"],
+    }),
+}
+
+# One `#include <header>` line, optionally followed by a // comment
+INCLUDE_LINE = re.compile(r'^\s*#\s*include\s*<([^<>]+)>\s*(?://.*)?$')
+
+
+def leading_includes(source: str):
+    """
+    Headers of the #include <...> lines at the top of source, before anything
+    else but blank lines and comments. Stops at the first other line, so a
+    #define or #pragma ahead of the includes leaves nothing to precompile.
+    """
+    headers = []
+    in_comment = False
+
+    for line in source.splitlines():
+        stripped = line.strip()
+        if in_comment:
+            if "*/" not in stripped:
+                continue
+            in_comment = False
+            stripped = stripped.split("*/", 1)[1].strip()
+
+        if not stripped or stripped.startswith("//"):
+            continue
+        if stripped.startswith("/*"):
+            rest = stripped[2:]
+            if "*/" not in rest:
+                in_comment = True
+                continue
+            if rest.split("*/", 1)[1].strip():
+                break
+            continue
+
+        match = INCLUDE_LINE.match(line)
+        if not match:
+            break
+        headers.append(match.group(1).strip())
+
+    return headers
+
+
+class PrecompiledHeaders:
+    """
+    The precompiled header sets of one compiler and compile profile.
+    Only sets whose .gch was built by the installed compiler with these flags are used.
+    """
+
+    def __init__(self, language: str, profile: str = DEFAULT_PROFILE, pch_dir: str = PCH_DIR):
+        self.compiler, flags, self.header_sets = PCH_TOOLCHAINS[language]
+        self.flags = flags + COMPILE_PROFILES[language][profile]
+        self.pch_dir = os.path.join(pch_dir, language, profile)
+        self.ready = {}
+        self._digests = {}  # name -> (sha256 of the .gch, stat it was last checked at)
+        self._checked = False
+        self._lock = threading.Lock()
+        hide_from_sandbox(pch_dir)
+
+    def _paths(self, name: str):
+        header = os.path.join(self.pch_dir, f"{name}.h")
+        return header, header + ".gch", header + ".stamp"
+
+    def stamp(self) -> str:
+        """Compiler version and flags the headers must have been built with"""
+        try:
+            result = subprocess.run(
+                [self.compiler, "--version"],
+                capture_output=True,
+                text=True,
+                timeout=5
+            )
+            version = result.stdout.split("\n", 1)[0]
+        except (OSError, subprocess.TimeoutExpired):
+            version = "unknown"
+        return "\0".join([version] + self.flags)
+
+    def _is_current(self, name: str, headers, stamp: str) -> bool:
+        header, gch, stamp_path = self._paths(name)
+        try:
+            with open(header) as f:
+                if f.read() != self._wrapper(headers):
+                    return False
+            # The stamp file ends with the digest of the .gch built with it
+            with open(stamp_path) as f:
+                built_with, _, digest = f.read().rpartition("\0sha256=")
+        except OSError:
+            return False
+        if built_with != stamp:
+            return False
+        self._digests[name] = (digest, None)
+        return self._verify(name)
+
+    def _verify(self, name: str) -> bool:
+        """Whether the .gch still has its recorded digest, rehashed only when the file changed"""
+        gch = self._paths(name)[1]
+        digest, checked = self._digests[name]
+        try:
+            info = os.stat(gch)
+            current = (info.st_ino, info.st_size, info.st_mtime_ns)
+            if current != checked:
+                if file_digest(gch) != digest:
+                    return False
+                self._digests[name] = (digest, current)
+        except OSError:
+            return False
+        return True
+
+    @staticmethod
+    def _wrapper(headers) -> str:
+        return "".join(f"#include <{header}>\n" for header in headers)
+
+    def _build_one(self, name: str, headers, stamp: str) -> bool:
+        header, gch, stamp_path = self._paths(name)
+        language = "c++-header" if self.compiler == "g++" else "c-header"
+
+        # Build next to the target and rename, compiles in flight never see half a file
+        staging = f"{gch}.{os.getpid()}.tmp"
+        try:
+            with open(header, "w") as f:
+                f.write(self._wrapper(headers))
+            result = subprocess.run(
+                [self.compiler] + self.flags + ["-x", language, header, "-o", staging],
+                capture_output=True,
+                text=True,
+                timeout=PCH_BUILD_TIMEOUT
+            )
+            if result.returncode != 0:
+                print(f"Failed to precompile {name}: {result.stderr.strip()}")
+                return False
+            digest = file_digest(staging)
+            os.rename(staging, gch)
+            with open(stamp_path, "w") as f:
+                f.write(f"{stamp}\0sha256={digest}")
+            self._digests[name] = (digest, None)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print(f"Failed to precompile {name}: {e}")
+            return False
+        finally:
+            if os.path.exists(staging):
+                os.unlink(staging)
+        return True
+
+    def ensure(self):
+        """Find the usable header sets, building any that are missing or stale"""
+        with self._lock:
+            if self._checked:
+                return
+            self._checked = True
+
+            stamp = self.stamp()
+            try:
+                os.makedirs(self.pch_dir, exist_ok=True)
+            except OSError as e:
+                print(f"Precompiled headers unavailable: {e}")
+                return
+
+            for name, headers in self.header_sets.items():
+                start_time = time.time()
+                if self._is_current(name, headers, stamp):
+                    self.ready[name] = headers
+                elif self._build_one(name, headers, stamp):
+                    self.ready[name] = headers
+                    print(f"Precompiled {', '.join(headers)} in {time.time() - start_time:.1f}s")
+
+    def match(self, source: str):
+        """Wrapper header of the longest ready set the source starts by including, or None"""
+        if not PCH_ENABLED:
+            return None
+        self.ensure()
+
+        includes = leading_includes(source)
+        with self._lock:
+            for name, headers in sorted(self.ready.items(), key=lambda item: -len(item[1])):
+                if includes[:len(headers)] != headers:
+                    continue
+                if self._verify(name):
+                    return self._paths(name)[0]
+                # Changed since it was built, compile without it from now on
+                print(f"Precompiled header {name} failed its checksum, disabling it")
+                del self.ready[name]
+                return None
+        return None
+
+    def compile_args(self, source: str):
+        """Extra compiler arguments for source, empty when no precompiled header fits"""
+        header = self.match(source)
+        return ["-include", header] if header else []
+
+
+if __name__ == "__main__":
+    for language in sys.argv[1:] or PCH_TOOLCHAINS:
+        for profile in COMPILE_PROFILES[language]:
+            headers = PrecompiledHeaders(language, profile)
+            headers.ensure()
+            print(f"{language} {profile}: {len(headers.ready)}/{len(headers.header_sets)} header sets ready in {headers.pch_dir}")
@@ -2,9 +2,113 @@ from connect import create_redis_connection
 import redis
 from redis import Redis
 import re
-import json
 import time
 import os
+import msgpack
+from grading import parse_test_cases
+
+# Cap on entries kept in a job's output stream, and how long the stream lives
+OUTPUT_STREAM_MAXLEN = 10000
+OUTPUT_STREAM_TTL = 3600
+
+class OutputStream:
+    """
+    Appends a running job's output chunks to the Redis Stream output:{job_id}.
+    Readers resume from the last entry id they saw; an `end` entry marks completion.
+    """
+
+    def __init__(self, redis_conn, job_id):
+        self.redis_conn = redis_conn
+        self.key = f"output:{job_id}"
+        self._expire_set = False
+
+    def __call__(self, stream, data):
+        try:
+            self.redis_conn.xadd(
+                self.key,
+                {"stream": stream, "data": data},
+                maxlen=OUTPUT_STREAM_MAXLEN,
+                approximate=True
+            )
+            if not self._expire_set:
+                self.redis_conn.expire(self.key, OUTPUT_STREAM_TTL)
+                self._expire_set = True
+        except Exception as e:
+            # Streaming is best effort, the final result still carries the output
+            print(f"Failed to stream output to {self.key}: {e}")
+
+    def close(self):
+        try:
+            pipe = self.redis_conn.pipeline()
+            pipe.xadd(self.key, {"stream": "end", "data": ""}, maxlen=OUTPUT_STREAM_MAXLEN, approximate=True)
+            pipe.expire(self.key, OUTPUT_STREAM_TTL)
+            pipe.execute()
+        except Exception as e:
+            print(f"Failed to close output stream {self.key}: {e}")
+
+# Bump when the layout of the result record changes, the API reads every version it knows
+RESULT_RECORD_VERSION = 1
+
+def pack_result(job, status, result=None, error=None):
+    """
+    Encode the result record stored in the job hash's `record` field.
+    It is exactly what get_result returns, so the API decodes it once and serves it as is.
+    """
+    return msgpack.packb({
+        "v": RESULT_RECORD_VERSION,
+        "status": status,
+        "result": result,
+        "error": error,
+        "completed_at": time.time(),
+        "job_info": {
+            "created_at": job.get("created_at"),
+            "language": job.get("language"),
+            "filename": job.get("filename")
+        }
+    }, use_bin_type=True, default=str)
+
+def write_result(redis_conn, job_id, job, status, result=None, error=None):
+    """
+    Store the final record and status in one atomic write, then wake up streaming readers
+    """
+    pipe = redis_conn.pipeline()
+    pipe.hset(f"job:{job_id}", mapping={
+        "status": status,
+        "record": pack_result(job, status, result, error)
+    })
+    pipe.publish(f"job_done:{job_id}", status)
+    pipe.execute()
+
+# Job hash fields a worker needs; the hash also holds the binary result record
+JOB_FIELDS = ("code", "filename", "language", "status", "stream", "created_at", "profile", "test_cases")
+
+def read_job(redis_conn, job_id):
+    """Job fields that are set, {} if the job doesn't exist"""
+    values = redis_conn.hmget(f"job:{job_id}", JOB_FIELDS)
+    return {field: value for field, value in zip(JOB_FIELDS, values) if value is not None}
+
+def fail_job(redis_conn, job_id, error):
+    """Record a job as failed without running it"""
+    try:
+        job = read_job(redis_conn, job_id)
+        if job and job.get("status") not in ("completed", "failed"):
+            write_result(redis_conn, job_id, job, "failed", error=error)
+    except Exception as e:
+        print(f"Failed to mark job {job_id} as failed: {e}")
+
+# Phases of execution_time the sandboxes report, whatever is left is setup
+# (workspace, writing the source, compile cache lookups)
+PHASE_FIELDS = ("compile_time", "sandbox_startup_time", "run_time")
+
+def add_phase_timings(result, job, start_time):
+    """Queue wait and setup time next to the phases the sandbox measured"""
+    try:
+        result['queue_time'] = max(0.0, start_time - float(job.get("created_at")))
+    except (TypeError, ValueError):
+        result['queue_time'] = None
+
+    measured = sum(result.get(field) or 0.0 for field in PHASE_FIELDS)
+    result['setup_time'] = max(0.0, result['execution_time'] - measured)
 
 def process_job(job_id, redis_conn, execute_code, language):
     """
@@ -17,14 +121,20 @@ def process_job(job_id, redis_conn, execute_code, language):
         return False
 
     # Get job from redis
+    job = {}
     try:
-        job = redis_conn.hgetall(f"job:{job_id}")
+        job = read_job(redis_conn, job_id)
         print(f"Got job data: {job}")
         
         # Check language
         if not job:
             print(f"Job {job_id} not found in Redis")
             return False
+
+        # Reclaimed after its worker stored the result but died before acking
+        if job.get("status") in ("completed", "failed"):
+            print(f"Job {job_id} already {job['status']}, skipping")
+            return True
             
         if job.get("language") != language:
             print(f"Language mismatch: job has {job.get('language')}, worker is {language}")
@@ -41,45 +151,44 @@ def process_job(job_id, redis_conn, execute_code, language):
         if not code or not filename:
             error_msg = "Missing code or filename"
             print(error_msg)
-            redis_conn.hset(f"job:{job_id}", "status", "failed")
-            redis_conn.hset(f"job:{job_id}", "error", error_msg)
+            write_result(redis_conn, job_id, job, "failed", error=error_msg)
             return False
         
+        # Stream output chunks while the job runs if the client asked for it
+        output_stream = OutputStream(redis_conn, job_id) if job.get("stream") == "1" else None
+
+        # Grading jobs carry stdin inputs, the program is built once and run per case
+        test_cases = parse_test_cases(job.get("test_cases"))
+
         # Execute the code
         print(f"Executing code for job {job_id}, language: {language}")
         start_time = time.time()
-        result = execute_code(code, filename)
+        try:
+            result = execute_code(
+                code, filename, on_output=output_stream, profile=job.get("profile"), test_cases=test_cases
+            )
+        finally:
+            if output_stream:
+                output_stream.close()
         execution_time = time.time() - start_time
         print(f"Job {job_id} completed in {execution_time:.3f}s")
         print(f"Execution result: {result}")
         
-        # Add execution time to result
+        # Add execution time and its phases to the result
         if isinstance(result, dict):
             result['execution_time'] = execution_time
-        
-        # Convert result to JSON string
-        try:
-            result_json = json.dumps(result)
-            print(f"Result JSON: {result_json}")
-        except Exception as e:
-            print(f"Error serializing result: {e}")
-            result_json = json.dumps({"success": False, "error": "Result serialization failed"})
+            add_phase_timings(result, job, start_time)
         
         # Update job in Redis
         try:
-            pipe = redis_conn.pipeline()
-            pipe.hset(f"job:{job_id}", "result", result_json)
-            pipe.hset(f"job:{job_id}", "status", "completed")
-            pipe.hset(f"job:{job_id}", "completed_at", str(time.time()))
-            pipe.execute()
+            write_result(redis_conn, job_id, job, "completed", result=result)
             print(f"Successfully updated job {job_id} in Redis with completed status")
             return True
         except Exception as e:
             print(f"Failed to update job status in Redis: {e}")
-            # Try again with individual commands
+            # Try again once, the record is written in a single command either way
             try:
-                redis_conn.hset(f"job:{job_id}", "result", result_json)
-                redis_conn.hset(f"job:{job_id}", "status", "completed")
+                write_result(redis_conn, job_id, job, "completed", result=result)
                 print("Successfully updated job status on second attempt")
                 return True
             except Exception as e2:
@@ -91,8 +200,7 @@ def process_job(job_id, redis_conn, execute_code, language):
         print(error_message)
         
         try:
-            redis_conn.hset(f"job:{job_id}", "status", "failed")
-            redis_conn.hset(f"job:{job_id}", "error", error_message)
+            write_result(redis_conn, job_id, job, "failed", error=error_message)
         except Exception as redis_err:
             print(f"Failed to update job error in Redis: {redis_err}")
             
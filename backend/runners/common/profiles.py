@@ -0,0 +1,27 @@
+# Compile profiles a submission can pick, and the vetted flags each adds to
+# the compile command per language. Flags are part of the compile command,
+# so the compile cache and the precompiled headers are kept per profile.
+DEFAULT_PROFILE = "fast-compile"
+
+COMPILE_PROFILES = {
+    "c": {
+        "fast-compile": [],
+        "optimized": ["-O2"],
+    },
+    "cpp": {
+        "fast-compile": [],
+        "optimized": ["-O2"],
+    },
+    "rust": {
+        "fast-compile": [],                     # Debug build
+        "optimized": ["-C", "opt-level=2"],     # Same as rustc -O
+    },
+}
+
+
+def profile_flags(language, profile):
+    """(profile name, flags) for the job, unknown or missing profiles get the default"""
+    profiles = COMPILE_PROFILES[language]
+    if profile not in profiles:
+        profile = DEFAULT_PROFILE
+    return profile, profiles[profile]
@@ -1,43 +1,141 @@
+import os
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from redis import Redis
 import redis
-from process import process_job
+from process import process_job, fail_job
 from connect import create_redis_connection
+from firejail import RLIMIT_AS, sandbox_startup_time
+from job_queue import JobQueue, MAX_DELIVERIES, consumer_name
+from workspace import workspace_pool
+
+# Seconds between checks for jobs stuck with dead workers
+RECLAIM_INTERVAL = 30
+
+def machine_memory():
+    """
+    Memory available to this machine in bytes, from WORKER_MEMORY_BYTES,
+    the cgroup limit or /proc/meminfo. None if unknown.
+    """
+    if os.getenv("WORKER_MEMORY_BYTES"):
+        return int(os.getenv("WORKER_MEMORY_BYTES"))
+
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        if limit != "max":
+            return int(limit)
+    except (OSError, ValueError):
+        pass
+
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+def worker_concurrency():
+    """
+    Number of jobs run in parallel. Defaults to one per core (WORKER_CONCURRENCY overrides),
+    capped so that every job hitting its firejail memory limit still fits in the machine.
+    """
+    requested = int(os.getenv("WORKER_CONCURRENCY", "0")) or os.cpu_count() or 1
+
+    memory = machine_memory()
+    if memory:
+        requested = min(requested, memory // RLIMIT_AS)
+
+    return max(1, requested)
 
 def run_worker(queue_name, execute_func, language):
     """
     Generic worker loop with improved error handling.
+    Pulls a job only when one of the executor slots is free, and acks it
+    once processed; jobs of workers that died are reclaimed from the stream.
     """
-    print(f"{language.capitalize()} worker started")
+    concurrency = worker_concurrency()
+    print(f"{language.capitalize()} worker started ({concurrency} concurrent jobs)")
     last_job_time = time.time()
     max_idle_time = 300
     max_retries = 5
     retry_delay = 2
+
+    slots = threading.BoundedSemaphore(concurrency)
+    state_lock = threading.Lock()
+    active_jobs = 0
+    pool = ThreadPoolExecutor(max_workers=concurrency)
+    workspace_pool.prefill(concurrency)
+    sandbox_startup_time()  # Calibrate before the first job is timed
+
+    def run_job(job_id, stream, entry_id, queue):
+        nonlocal active_jobs, last_job_time
+        try:
+            process_job(job_id, queue.redis_conn, execute_func, language)
+        except Exception as e:
+            print(f"Unexpected error in job {job_id}: {e}")
+        finally:
+            # Failed jobs are acked too, only a dead worker leaves a job pending
+            try:
+                queue.ack(stream, entry_id)
+            except redis.RedisError as e:
+                print(f"Failed to ack job {job_id}, it will be reclaimed: {e}")
+            with state_lock:
+                active_jobs -= 1
+                last_job_time = time.time()
+            slots.release()
     
+    def dead_letter(job_id):
+        fail_job(queue.redis_conn, job_id, f"Job abandoned after {MAX_DELIVERIES} attempts")
+
+    consumer = consumer_name()
+    last_reclaim = 0
+
     try:
         redis_conn = create_redis_connection()
+        queue = JobQueue(redis_conn, queue_name, consumer)
+        queue.migrate_legacy_queue()
         
         while True:
             retries = 0
             while retries < max_retries:
+                slots.acquire()
                 try:
-                    # Get job from queue
-                    job_id = redis_conn.brpop(f"queue:{queue_name}", timeout=30)
+                    # Stalled jobs first, then new ones, fairly across lanes
+                    job = None
+                    if time.time() - last_reclaim > RECLAIM_INTERVAL:
+                        reclaimed = queue.reclaim(1, dead_letter)
+                        if reclaimed:
+                            job = reclaimed[0]
+                        else:
+                            last_reclaim = time.time()
+                    if job is None:
+                        job = queue.read(block_ms=30000)
                     
-                    if job_id:
-                        job_id = job_id[1]
-                        print(f"Processing job: {job_id}")
-                        process_job(job_id, redis_conn, execute_func, language)
-                        last_job_time = time.time()
-                    elif time.time() - last_job_time > max_idle_time:
-                        print("Idle timeout reached, shutting down")
-                        return
+                    if job:
+                        stream, entry_id, job_id = job
+                        print(f"Processing job: {job_id} ({stream})")
+                        with state_lock:
+                            active_jobs += 1
+                        pool.submit(run_job, job_id, stream, entry_id, queue)
+                    else:
+                        slots.release()
+                        with state_lock:
+                            idle = active_jobs == 0 and time.time() - last_job_time > max_idle_time
+                        if idle:
+                            print("Idle timeout reached, shutting down")
+                            return
                     
                     # Reset retries on success
                     retries = 0
                     break
                     
                 except redis.RedisError as e:
+                    slots.release()
                     retries += 1
                     print(f"Redis error: {e} (retry {retries}/{max_retries})")
                     
@@ -46,6 +144,7 @@ def run_worker(queue_name, execute_func, language):
                         print("Max retries reached, attempting to recreate connection")
                         try:
                             redis_conn = create_redis_connection()
+                            queue = JobQueue(redis_conn, queue_name, consumer)
                             retries = 0
                         except Exception as conn_err:
                             print(f"Failed to reconnect: {conn_err}")
@@ -54,10 +153,14 @@ def run_worker(queue_name, execute_func, language):
                         time.sleep(retry_delay)
                         
                 except Exception as e:
+                    slots.release()
                     print(f"Unexpected error in job processing: {e}")
                     time.sleep(1)
                 
     except KeyboardInterrupt:
         print("KeyboardInterrupt received - shutting down worker...")
     except Exception as e:
-        print(f"Fatal error in worker loop: {e}")
\ No newline at end of file
+        print(f"Fatal error in worker loop: {e}")
+    finally:
+        # Let in-flight jobs finish and store their results
+        pool.shutdown(wait=True)
\ No newline at end of file
@@ -0,0 +1,142 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from firejail import RLIMIT_FSIZE
+
+# Job workspaces live on a RAM backed filesystem, falling back to the temp dir
+# on machines without /dev/shm
+DISK_WORKSPACE_ROOT = os.path.join(tempfile.gettempdir(), "codr-workspaces")
+WORKSPACE_ROOT = os.getenv(
+    "WORKSPACE_ROOT",
+    "/dev/shm/codr-workspaces" if os.path.isdir("/dev/shm") else DISK_WORKSPACE_ROOT
+)
+# Total bytes a job may write to its workspace. --rlimit-fsize caps each file at
+# RLIMIT_FSIZE, the quota caps all of them together, compiler output included.
+WORKSPACE_QUOTA_BYTES = int(os.getenv("WORKSPACE_QUOTA_BYTES", str(64 * RLIMIT_FSIZE)))
+# Scrubbed workspaces kept for reuse, extra ones are deleted
+WORKSPACE_POOL_MAX = int(os.getenv("WORKSPACE_POOL_MAX", "32"))
+# Free space the root needs when workspaces can't get their own tmpfs
+WORKSPACE_MIN_FREE_BYTES = int(os.getenv("WORKSPACE_MIN_FREE_BYTES", str(4 * WORKSPACE_QUOTA_BYTES)))
+
+
+class WorkspacePool:
+    """
+    Pre-created job directories on tmpfs, scrubbed and reused between jobs.
+
+    Each workspace is mounted as its own tmpfs of quota_bytes where the worker
+    may mount (root with CAP_SYS_ADMIN, as on Fly machines), so a job filling it
+    gets ENOSPC without touching other jobs. Elsewhere workspaces are plain
+    directories on the shared RAM filesystem and only --rlimit-fsize applies.
+    If that filesystem can't run programs or is too small (Docker's /dev/shm
+    is noexec and 64MB) they move to the temp dir on disk instead.
+    """
+
+    def __init__(self, root: str, quota_bytes: int, max_idle: int):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.max_idle = max_idle
+        self.mounts = None  # Whether workspaces get their own tmpfs, decided on first create
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _mount(self, path: str) -> bool:
+        try:
+            result = subprocess.run(
+                ["mount", "-t", "tmpfs", "-o", f"size={self.quota_bytes},mode=0700", "tmpfs", path],
+                capture_output=True,
+                text=True,
+                timeout=5
+            )
+            return result.returncode == 0
+        except (OSError, subprocess.TimeoutExpired):
+            return False
+
+    def _unusable(self, root: str):
+        """Why plain directories under root can't hold workspaces, None if they can"""
+        try:
+            info = os.statvfs(root)
+        except OSError as e:
+            return str(e)
+        if info.f_flag & os.ST_NOEXEC:
+            return "is mounted noexec"
+        free = info.f_bavail * info.f_frsize
+        if free < WORKSPACE_MIN_FREE_BYTES:
+            return f"has only {free // (1024 * 1024)}MB free"
+        return None
+
+    def _create(self) -> str:
+        os.makedirs(self.root, mode=0o700, exist_ok=True)
+        path = tempfile.mkdtemp(dir=self.root)
+
+        if self.mounts is not False:
+            mounted = self._mount(path)
+            if self.mounts is None:
+                self.mounts = mounted
+                if not mounted:
+                    problem = self._unusable(self.root)
+                    if problem and self.root != DISK_WORKSPACE_ROOT:
+                        print(f"Cannot mount tmpfs workspaces and {self.root} {problem}, moving to {DISK_WORKSPACE_ROOT}")
+                        os.rmdir(path)
+                        self.root = DISK_WORKSPACE_ROOT
+                        return self._create()
+                    print(f"Cannot mount tmpfs workspaces, using directories in {self.root} without a quota")
+
+        return path
+
+    def _destroy(self, path: str):
+        if self.mounts:
+            subprocess.run(["umount", "-l", path], capture_output=True)
+        shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def _scrub(path: str):
+        """Remove everything a job left behind, keeping the directory itself"""
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+        os.chmod(path, 0o700)
+
+    def prefill(self, count: int):
+        """Create workspaces up front so the first jobs don't pay for it"""
+        with self._lock:
+            missing = min(count, self.max_idle) - len(self._idle)
+        created = [self._create() for _ in range(max(0, missing))]
+        with self._lock:
+            self._idle += created
+        if created:
+            print(f"Prepared {len(created)} workspaces in {self.root}")
+
+    @contextmanager
+    def workspace(self):
+        """An empty directory for one job, drop-in for tempfile.TemporaryDirectory()"""
+        with self._lock:
+            path = self._idle.pop() if self._idle else None
+        if path is None:
+            path = self._create()
+
+        try:
+            yield path
+        finally:
+            try:
+                self._scrub(path)
+                reusable = True
+            except OSError as e:
+                print(f"Failed to scrub workspace {path}: {e}")
+                reusable = False
+
+            with self._lock:
+                if reusable and len(self._idle) < self.max_idle:
+                    self._idle.append(path)
+                    path = None
+            if path is not None:
+                self._destroy(path)
+
+
+workspace_pool = WorkspacePool(WORKSPACE_ROOT, WORKSPACE_QUOTA_BYTES, WORKSPACE_POOL_MAX)
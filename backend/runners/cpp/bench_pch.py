@@ -0,0 +1,156 @@
+"""
+Compile time benchmark, precompiled headers vs plain g++.
+Compiles a corpus of typical submissions both ways with the sandbox's compile
+command, checks both binaries print the same thing and reports the times.
+Builds the headers in PCH_DIR first if they are missing. Run it in the cpp
+runner image, or anywhere with g++ and the common runner files on the path:
+
+    python bench_pch.py [runs]
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from pch import PrecompiledHeaders, leading_includes
+
+CORPUS = {
+    "stdcxx_sort": """#include <bits/stdc++.h>
+using namespace std;
+
+int main() {
+    vector<int> v = {5, 3, 8, 1, 9, 2};
+    sort(v.begin(), v.end());
+    for (int x : v) cout << x << " ";
+    cout << endl;
+    return 0;
+}
+""",
+    "stdcxx_map": """// word frequencies
+#include <bits/stdc++.h>
+using namespace std;
+
+int main() {
+    map<string, int> counts;
+    string text = "the quick brown fox jumps over the lazy dog the end";
+    stringstream ss(text);
+    string word;
+    while (ss >> word) counts[word]++;
+    for (auto &p : counts) cout << p.first << ": " << p.second << "\\n";
+}
+""",
+    "iostream_hello": """#include <iostream>
+
+int main() {
+    std::cout << "Hello, World!" << std::endl;
+    return 0;
+}
+""",
+    "iostream_vector": """#include <iostream>
+#include <vector>
+using namespace std;
+
+int main() {
+    vector<long long> fib = {0, 1};
+    for (int i = 2; i < 50; i++) fib.push_back(fib[i - 1] + fib[i - 2]);
+    cout << fib.back() << endl;
+}
+""",
+    "iostream_string": """#include <iostream>
+#include <string>
+#include <algorithm>
+
+int main() {
+    std::string s = "racecar";
+    std::string r(s.rbegin(), s.rend());
+    std::cout << (s == r ? "palindrome" : "not a palindrome") << std::endl;
+}
+""",
+    "iostream_vector_algorithm": """/* binary search */
+#include <iostream>
+#include <vector>
+#include <algorithm>
+using namespace std;
+
+int main() {
+    vector<int> v;
+    for (int i = 0; i < 100; i += 3) v.push_back(i);
+    cout << binary_search(v.begin(), v.end(), 42) << " " << *lower_bound(v.begin(), v.end(), 50) << endl;
+}
+""",
+    "cstdio_no_pch": """#include <cstdio>
+#include <cmath>
+
+int main() {
+    printf("%.5f\\n", std::sqrt(2.0));
+}
+""",
+    "define_first_no_pch": """#define N 10
+#include <iostream>
+
+int main() {
+    int total = 0;
+    for (int i = 1; i <= N; i++) total += i;
+    std::cout << total << std::endl;
+}
+""",
+}
+
+# Same flags as the sandbox, which must match PCH_TOOLCHAINS["cpp"]
+def compile_cmd(extra):
+    return ["g++", "-std=c++11", *extra, "main.cpp", "-o", "a.out", "-lstdc++"]
+
+
+def compile_and_run(code, extra):
+    """(compile seconds, program output)"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, "main.cpp"), "w") as f:
+            f.write(code)
+
+        start = time.perf_counter()
+        result = subprocess.run(compile_cmd(extra), cwd=tmpdir, capture_output=True, text=True, timeout=60)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"Compilation failed:\n{result.stderr}")
+
+        output = subprocess.run([os.path.join(tmpdir, "a.out")], capture_output=True, text=True, timeout=10)
+        return elapsed, output.stdout
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    headers = PrecompiledHeaders("cpp")
+    headers.ensure()
+    print(f"{len(headers.ready)}/{len(headers.header_sets)} header sets ready in {headers.pch_dir}")
+
+    plain_total = 0.0
+    pch_total = 0.0
+    for name, code in CORPUS.items():
+        extra = headers.compile_args(code)
+        plain, pch = [], []
+        for _ in range(runs):
+            elapsed, plain_output = compile_and_run(code, [])
+            plain.append(elapsed)
+            elapsed, pch_output = compile_and_run(code, extra)
+            pch.append(elapsed)
+            if plain_output != pch_output:
+                print(f"MISMATCH ({name}): {plain_output!r} vs {pch_output!r}")
+                sys.exit(1)
+
+        plain_total += statistics.median(plain)
+        pch_total += statistics.median(pch)
+        used = os.path.basename(extra[1]) if extra else "-"
+        print(
+            f"{name:>26}: plain {statistics.median(plain) * 1000:7.0f} ms"
+            f"  pch {statistics.median(pch) * 1000:7.0f} ms  ({used}, includes {leading_includes(code)})"
+        )
+
+    print(f"corpus total: plain {plain_total:.2f}s  pch {pch_total:.2f}s  ({1 - pch_total / plain_total:.0%} less)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,28 @@
 import subprocess
 import os
-import tempfile
+import time
 import resource
 from firejail import firejail_execute
+from workspace import workspace_pool
+from compile_cache import compile_cache
+from grading import run_test_cases
+from pch import PrecompiledHeaders
+from profiles import COMPILE_PROFILES, profile_flags
 import re
 
-def execute_code(code: str, filename: str):
+# Flags must match PCH_TOOLCHAINS["cpp"] for the precompiled headers to load,
+# each profile has its own
+precompiled_headers = {profile: PrecompiledHeaders("cpp", profile) for profile in COMPILE_PROFILES["cpp"]}
+
+def execute_code(code: str, filename: str, on_output=None, profile=None, test_cases=None):
     """
     C++ Sandbox.
     Create temp directory. Write code to file in dir. Compile and run code in firejail.   
+    With test_cases it is compiled once and run once per case.
+    profile picks the compile flags (fast-compile or optimized).
     """
 
-    with tempfile.TemporaryDirectory() as tmpdir:
+    with workspace_pool.workspace() as tmpdir:
 
         if not re.match(r'^[a-zA-Z0-9_.-]+$', filename):
             return {
@@ -28,34 +39,53 @@ def execute_code(code: str, filename: str):
             f.write(code)
         
 
+        # Relative paths so cached compile errors don't mention another job's tmpdir.
+        # Standard headers the code starts by including come precompiled.
+        profile, flags = profile_flags("cpp", profile)
         compile_cmd = [
                 "g++",
                 "-std=c++11",
-                file_path, 
+                *flags,
+                *precompiled_headers[profile].compile_args(code),
+                filename, 
                 "-o", 
-                output_path, 
+                "a.out", 
                 "-lstdc++"
         ]
 
         try:
-            compile_result = subprocess.run(
-                compile_cmd,
-                capture_output=True,
-                text=True,
-                timeout=5
+            start_time = time.time()
+            returncode, compile_stderr, cache_stats = compile_cache.compile(
+                compile_cmd, code, tmpdir, "a.out", timeout=5
             )
+            compile_time = time.time() - start_time
             
-            if compile_result.returncode != 0:
+            if returncode != 0:
                 return {
                     "success": False,
                     "stdout": "",
-                    "stderr": f"Compilation error:\n{compile_result.stderr}",
-                    "exit_code": compile_result.returncode
+                    "stderr": f"Compilation error:\n{compile_stderr}",
+                    "exit_code": returncode,
+                    "compile_cache": cache_stats,
+                    "profile": profile,
+                    "compile_time": compile_time
                 }
             
             # Set executable permissions & Run
             os.chmod(output_path, 0o755)
-            return firejail_execute([output_path], tmpdir)
+            if test_cases:
+                result = run_test_cases(
+                    lambda stdin, output_limit, timeout: firejail_execute(
+                        [output_path], tmpdir, timeout=timeout, on_output=on_output, stdin=stdin, output_limit=output_limit
+                    ),
+                    test_cases
+                )
+            else:
+                result = firejail_execute([output_path], tmpdir, on_output=on_output)
+            result["compile_time"] = compile_time
+            result["profile"] = profile
+            result["compile_cache"] = cache_stats
+            return result
 
         except subprocess.TimeoutExpired:
             return {
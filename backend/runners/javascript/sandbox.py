@@ -1,16 +1,18 @@
 import subprocess
 import os
-import tempfile
 from firejail import firejail_execute
+from workspace import workspace_pool
+from grading import run_test_cases
 import re
 
-def execute_code(code: str, filename: str):
+def execute_code(code: str, filename: str, on_output=None, profile=None, test_cases=None):
     """
     JavaScript Sandbox.
     Create temp directory. Write code to file in dir. Compile and run code in firejail.   
+    With test_cases it runs once per case. Interpreted, so there is no compile profile to apply.
     """
 
-    with tempfile.TemporaryDirectory() as tmpdir:
+    with workspace_pool.workspace() as tmpdir:
 
         if not re.match(r'^[a-zA-Z0-9_.-]+$', filename):
             return {
@@ -36,4 +38,12 @@ def execute_code(code: str, filename: str):
             file_path
         ]
 
-        return firejail_execute(node_cmd, tmpdir) 
+        if test_cases:
+            return run_test_cases(
+                lambda stdin, output_limit, timeout: firejail_execute(
+                    node_cmd, tmpdir, timeout=timeout, on_output=on_output, stdin=stdin, output_limit=output_limit
+                ),
+                test_cases
+            )
+
+        return firejail_execute(node_cmd, tmpdir, on_output=on_output)
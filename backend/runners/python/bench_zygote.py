@@ -0,0 +1,91 @@
+"""
+Time-to-first-byte benchmark, zygote vs cold firejail run.
+Needs firejail, run it inside the python runner image:
+
+    python bench_zygote.py [runs]
+"""
+
+import os
+import select
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from firejail import firejail_command
+from sandbox import get_zygote
+
+CODE = "print('hello')\n"
+FILENAME = "main.py"
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def cold_ttfb():
+    """Time until the first stdout byte of a fresh firejail + python3"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        file_path = os.path.join(tmpdir, FILENAME)
+        with open(file_path, "w") as f:
+            f.write(CODE)
+
+        start = time.perf_counter()
+        proc = subprocess.Popen(
+            firejail_command(["python3", file_path], tmpdir, timeout=10),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        select.select([proc.stdout], [], [], 15)
+        elapsed = time.perf_counter() - start
+        proc.stdout.read()
+        proc.wait()
+        return elapsed
+
+
+def zygote_ttfb():
+    """Time until the first output message of a forked job"""
+    zygote = get_zygote()
+    with zygote._lock:
+        if not zygote.ensure_started():
+            raise RuntimeError("Zygote failed to start")
+
+        start = time.perf_counter()
+        elapsed = None
+        for message in zygote.stream(CODE, FILENAME):
+            if elapsed is None and message["type"] == "output":
+                elapsed = time.perf_counter() - start
+        return elapsed
+
+
+def report(name, samples):
+    print(
+        f"{name:>7}: p50 {percentile(samples, 50) * 1000:8.1f} ms"
+        f"  p99 {percentile(samples, 99) * 1000:8.1f} ms"
+        f"  mean {statistics.mean(samples) * 1000:8.1f} ms"
+    )
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+
+    # Warm up both paths so the first zygote start is not counted
+    cold_ttfb()
+    zygote_ttfb()
+
+    cold = [cold_ttfb() for _ in range(runs)]
+    warm = [zygote_ttfb() for _ in range(runs)]
+
+    print(f"{runs} runs of {CODE.strip()!r}")
+    report("cold", cold)
+    report("zygote", warm)
+    print(f"p50 speedup: {percentile(cold, 50) / percentile(warm, 50):.1f}x")
+
+    get_zygote().stop()
+
+
+if __name__ == "__main__":
+    main()
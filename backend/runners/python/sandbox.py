@@ -2,33 +2,252 @@ import subprocess
 import os
 import tempfile
 import resource
+import select
 import signal
 import time
-from firejail import firejail_execute
+import json
+import threading
+import uuid
+from contextlib import ExitStack
+from firejail import firejail_execute, firejail_command, OutputBuffer, output_result, run_usage, OUTPUT_LIMIT_BYTES
+from workspace import workspace_pool
+from grading import run_test_cases
 import re
 
-def execute_code(code: str, filename: str):
+ZYGOTE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "zygote.py")
+ZYGOTE_ENABLED = os.getenv("PYTHON_ZYGOTE", "1") != "0"
+ZYGOTE_START_TIMEOUT = 10
+ZYGOTE_RETRY_DELAY = 60
+
+
+class ZygoteError(Exception):
+    """Zygote died or broke protocol, caller should fall back to a cold run"""
+
+
+class Zygote:
     """
-    Python Sandbox.
-    Create temp directory. Write code to file in dir. Compile and run code in firejail.   
+    Warm python parent running inside firejail.
+    Each job is forked from it instead of starting a new sandbox and interpreter.
     """
 
-    # Create temporary directory with restricted permissions
-    with tempfile.TemporaryDirectory() as tmpdir:
+    def __init__(self):
+        self.proc = None
+        self.tmpdir = None
+        self._home = ExitStack()
+        self._buffer = b""
+        self._lock = threading.Lock()
+        self._failed_at = 0
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        """Start the zygote and wait for it to finish preloading"""
+        # Job workdirs are created inside, a pooled workspace gives them the same quota as a cold run
+        self.tmpdir = self._home.enter_context(workspace_pool.workspace())
+        cmd = firejail_command(["python3", ZYGOTE_PATH], self.tmpdir, rlimits=False)
+
+        self.proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._buffer = b""
+
+        message = self._read_message(time.monotonic() + ZYGOTE_START_TIMEOUT)
+        if message.get("type") != "ready":
+            raise ZygoteError(f"Unexpected zygote greeting: {message}")
+        print(f"Python zygote ready (pid {self.proc.pid})")
+
+    def stop(self):
+        if self.proc is not None:
+            try:
+                self.proc.kill()
+                self.proc.wait(timeout=5)
+            except Exception:
+                pass
+        self.proc = None
+        # Scrubbed and handed back to the pool
+        self._home.close()
+        self.tmpdir = None
+
+    def ensure_started(self):
+        """Start the zygote if needed. Returns False while in retry backoff."""
+        if self.alive():
+            return True
+        if time.time() - self._failed_at < ZYGOTE_RETRY_DELAY:
+            return False
+
+        self.stop()
+        try:
+            self.start()
+            return True
+        except Exception as e:
+            print(f"Failed to start python zygote: {e}")
+            self._failed_at = time.time()
+            self.stop()
+            return False
+
+    def _read_message(self, deadline):
+        """Read one JSON line from the zygote, bounded by deadline"""
+        fd = self.proc.stdout.fileno()
+
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ZygoteError("Timed out waiting for zygote")
+
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                continue
+
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                raise ZygoteError("Zygote exited")
+            self._buffer += chunk
+
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        try:
+            return json.loads(line)
+        except json.JSONDecodeError:
+            raise ZygoteError("Invalid message from zygote")
+
+    def stream(self, code, filename, timeout=10, stdin=None, output_limit=OUTPUT_LIMIT_BYTES):
+        """
+        Send a job and yield protocol messages until its exit message.
+        Caller must hold the zygote lock.
+        """
+        job_id = str(uuid.uuid4())
+        # The zygote only reads the header, the forked child reads the payload
+        payload = json.dumps({"code": code, "filename": filename, "stdin": stdin}).encode()
+        header = {"id": job_id, "timeout": timeout, "output_limit": output_limit, "size": len(payload)}
+
+        try:
+            self.proc.stdin.write((json.dumps(header) + "\n").encode() + payload)
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise ZygoteError(f"Failed to send job to zygote: {e}")
+
+        # Zygote enforces the job timeout, this only guards against a hung zygote
+        deadline = time.monotonic() + timeout + 5
+        while True:
+            message = self._read_message(deadline)
+            if message.get("type") == "error":
+                raise ZygoteError(message.get("error"))
+            if message.get("id") != job_id:
+                continue
+
+            yield message
+            if message.get("type") == "exit":
+                return
+
+    def execute(self, code, filename, timeout=10, on_output=None, stdin=None, output_limit=OUTPUT_LIMIT_BYTES):
+        """
+        Run code in a forked child and collect its output, up to output_limit
+        bytes per stream (the zygote stops children writing more).
+        With on_output, chunks are also passed on as they arrive.
+        The fork replaces sandbox startup, so all the wall time counts as run time.
+        """
+        with self._lock:
+            if not self.ensure_started():
+                raise ZygoteError("Zygote unavailable")
+
+            start_time = time.time()
+            buffers = {"stdout": OutputBuffer(output_limit), "stderr": OutputBuffer(output_limit)}
+            try:
+                for message in self.stream(code, filename, timeout, stdin, output_limit):
+                    if message["type"] == "output":
+                        data = buffers[message["stream"]].append(message["data"].encode())
+                        if data and on_output is not None:
+                            on_output(message["stream"], data)
+                    elif message["type"] == "exit":
+                        exit_code = message["exit_code"]
+                        timed_out = message["timed_out"]
+                        usage = run_usage(
+                            time.time() - start_time, 0.0,
+                            message.get("cpu_user_time"), message.get("cpu_sys_time"), message.get("max_rss_bytes")
+                        )
+                        for name, truncated in message.get("truncated", {}).items():
+                            buffers[name].truncated |= truncated
+                        recycle = message.get("recycle", False)
+            except ZygoteError:
+                self.stop()
+                raise
 
-        if not re.match(r'^[a-zA-Z0-9_.-]+$', filename):
-            return {
-                "success": False,
-                "stdout": "",
-                "stderr": "Invalid filename",
-                "exit_code": 1
-            }
+            # The job left processes the zygote could not kill, don't run the next job beside them
+            if recycle:
+                print("Python zygote has leftover processes, restarting it")
+                self.stop()
+
+        result = output_result(buffers["stdout"], buffers["stderr"], exit_code, timeout, timed_out)
+        result.update(usage)
+        return result
+
+
+# One zygote per worker thread, a zygote serves one job at a time
+_local = threading.local()
+
+
+def get_zygote():
+    if not hasattr(_local, "zygote"):
+        _local.zygote = Zygote()
+    return _local.zygote
+
+
+def cold_execute(code: str, filename: str, on_output=None, stdin=None, output_limit=OUTPUT_LIMIT_BYTES, timeout=10):
+    """
+    Fallback path, a new firejail and interpreter for this job only.
+    """
+
+    # Scrubbed workspace from the tmpfs pool
+    with workspace_pool.workspace() as tmpdir:
 
         file_path = os.path.join(tmpdir, filename)
-        
+
         # Write code to file
         with open(file_path, 'w') as f:
             f.write(code)
 
-        return firejail_execute(["python3", file_path], tmpdir) 
-        
+        return firejail_execute(
+            ["python3", file_path], tmpdir, timeout=timeout, on_output=on_output, stdin=stdin, output_limit=output_limit
+        )
+
+
+def run_once(code: str, filename: str, on_output=None, stdin=None, output_limit=OUTPUT_LIMIT_BYTES, timeout=10):
+    """Fork the run from the warm zygote, or fall back to a cold firejail run"""
+    if ZYGOTE_ENABLED:
+        try:
+            return get_zygote().execute(
+                code, filename, timeout=timeout, on_output=on_output, stdin=stdin, output_limit=output_limit
+            )
+        except ZygoteError as e:
+            print(f"Zygote execution failed, falling back to cold run: {e}")
+
+    return cold_execute(code, filename, on_output=on_output, stdin=stdin, output_limit=output_limit, timeout=timeout)
+
+
+def execute_code(code: str, filename: str, on_output=None, profile=None, test_cases=None):
+    """
+    Python Sandbox.
+    Fork the job from the warm zygote, or fall back to a cold firejail run.
+    With test_cases it runs once per case. Interpreted, so there is no compile profile to apply.
+    """
+
+    if not re.match(r'^[a-zA-Z0-9_.-]+$', filename):
+        return {
+            "success": False,
+            "stdout": "",
+            "stderr": "Invalid filename",
+            "exit_code": 1
+        }
+
+    if test_cases:
+        return run_test_cases(
+            lambda stdin, output_limit, timeout: run_once(
+                code, filename, on_output=on_output, stdin=stdin, output_limit=output_limit, timeout=timeout
+            ),
+            test_cases
+        )
+
+    return run_once(code, filename, on_output=on_output)
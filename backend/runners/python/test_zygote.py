@@ -0,0 +1,87 @@
+"""
+Isolation tests for the python zygote: a job must not see anything of the
+jobs forked before it. Needs firejail, run them inside the python runner
+image (pytest is not part of it):
+
+    pip install pytest && python -m pytest test_zygote.py
+"""
+
+import os
+import shutil
+import sys
+
+import pytest
+
+# Outside the image the common runner files are in the sibling directory
+COMMON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common")
+if os.path.isdir(COMMON):
+    sys.path.insert(0, COMMON)
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [COMMON, os.getenv("PYTHONPATH")]))
+
+from sandbox import Zygote
+
+pytestmark = pytest.mark.skipif(shutil.which("firejail") is None, reason="needs firejail")
+
+MARKER = "SECRET_SOLUTION_QZQZQZQZ"
+
+# Scans the job's own memory for MARKER. It is only ever held in two halves,
+# so the search can't find itself.
+FIND_MARKER_IN_MEMORY = """
+import io
+
+PREFIX = b"SECRET_SOLUTION_"
+SUFFIX = b"QZQZ" + b"QZQZ"
+CHUNK = 1 << 20
+
+with io.FileIO("/proc/self/maps") as maps:
+    regions = maps.read().decode().splitlines()
+
+found = False
+with io.FileIO("/proc/self/mem") as mem:
+    for region in regions:
+        addresses, perms = region.split()[:2]
+        if not perms.startswith("r"):
+            continue
+        start, end = (int(address, 16) for address in addresses.split("-"))
+        for position in range(start, end, CHUNK):
+            try:
+                mem.seek(position)
+                data = mem.read(min(CHUNK + 64, end - position))
+            except (OSError, OverflowError, ValueError):
+                break
+            index = data.find(PREFIX)
+            while index != -1:
+                if data[index + len(PREFIX):index + len(PREFIX) + len(SUFFIX)] == SUFFIX:
+                    found = True
+                index = data.find(PREFIX, index + 1)
+
+print("found" if found else "clean")
+"""
+
+
+@pytest.fixture
+def zygote():
+    zygote = Zygote()
+    zygote.start()
+    yield zygote
+    zygote.stop()
+
+
+def test_job_cannot_read_earlier_job_from_memory(zygote):
+    # About 8KB of source, with its input carrying the marker too
+    padding = "".join(f"# line {i} of a long solution\n" for i in range(256))
+    code = f"SECRET = {MARKER!r}\nprint(len(SECRET), input())\n{padding}"
+    first = zygote.execute(code, "a.py", stdin=MARKER + "\n")
+    assert first["stdout"] == f"{len(MARKER)} {MARKER}\n"
+
+    second = zygote.execute(FIND_MARKER_IN_MEMORY, "b.py")
+    assert second["stderr"] == ""
+    assert second["stdout"] == "clean\n"
+
+
+def test_job_cannot_read_earlier_job_from_home(zygote):
+    code = "import os\nos.makedirs(os.path.expanduser('~/.cache'))\nopen(os.path.expanduser('~/.cache/left'), 'w').write('x')\n"
+    assert zygote.execute(code, "a.py")["success"]
+
+    second = zygote.execute("import os\nprint(os.path.exists(os.path.expanduser('~/.cache')))\n", "b.py")
+    assert second["stdout"] == "False\n"
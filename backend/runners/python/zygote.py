@@ -0,0 +1,437 @@
+"""
+Python zygote.
+Started once inside firejail, pre-imports common modules and then forks a
+fresh child per job. Output chunks and the exit status are written back as
+JSON lines on stdout.
+
+A request on stdin is a JSON header line (id, timeout, output_limit and the
+payload size) followed by the payload, the job's code, filename and stdin as
+JSON. The zygote only reads the header and forks a supervisor, which forks
+the job's child and relays its output. The child reads the payload itself,
+so neither a job's input nor its output ever is in the zygote's memory for a
+later child to inherit, and the home directory is emptied after every job.
+"""
+
+import ctypes
+import json
+import os
+import resource
+import select
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import traceback
+import types
+
+from firejail import RLIMIT_AS, RLIMIT_CPU, RLIMIT_FSIZE, OUTPUT_LIMIT_BYTES, OutputBuffer
+
+# Modules imported once in the parent so every child gets them for free
+PRELOAD = [
+    "math", "random", "collections", "itertools", "functools", "heapq",
+    "bisect", "string", "re", "json", "datetime", "decimal", "fractions",
+    "statistics", "typing", "dataclasses", "copy", "operator", "enum",
+    "textwrap", "abc", "array",
+]
+
+READ_SIZE = 65536
+
+# Longest request header, the payload comes after it
+MAX_HEADER_BYTES = 4096
+
+PR_SET_DUMPABLE = 4
+PR_SET_CHILD_SUBREAPER = 36
+# How long to keep killing a job's leftover processes before giving up on the zygote
+STRAY_KILL_TIMEOUT = 1.0
+# How often to check for the child's exit where pidfds are unavailable
+EXIT_POLL_INTERVAL = 0.01
+
+
+def preload():
+    for name in PRELOAD:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+
+def prctl(option, value, name):
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.prctl(option, value, 0, 0, 0) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"prctl({name}): {os.strerror(errno)}")
+
+
+def become_subreaper():
+    """
+    Adopt orphaned descendants, so processes a job double forks away are
+    reparented to the zygote instead of escaping kill_strays.
+    """
+    prctl(PR_SET_CHILD_SUBREAPER, 1, "PR_SET_CHILD_SUBREAPER")
+
+
+def descendants(root):
+    """Pids of every process below root, read from /proc"""
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # comm may contain spaces and parens, ppid is the second field after it
+                fields = f.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        children.setdefault(int(fields[1]), []).append(int(name))
+
+    found = []
+    stack = [root]
+    while stack:
+        for pid in children.get(stack.pop(), []):
+            found.append(pid)
+            stack.append(pid)
+    return found
+
+
+def reap():
+    """Collect every exited child without blocking"""
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+def kill_strays():
+    """
+    SIGKILL everything the last job left running, whatever its session or
+    process group. Returns False if processes survive, the zygote has to be
+    replaced then since they could read the next jobs' files.
+    """
+    deadline = time.monotonic() + STRAY_KILL_TIMEOUT
+    while True:
+        strays = descendants(os.getpid())
+        if not strays:
+            return True
+        if time.monotonic() > deadline:
+            return False
+
+        for pid in strays:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        reap()
+        time.sleep(0.001)
+
+
+def scrub(home):
+    """Empty the home directory, nothing a job writes there may reach the next job"""
+    with os.scandir(home) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+
+
+def read_header():
+    """
+    Next request header from the worker, None once it closes stdin. Read a
+    byte at a time so the payload after it stays in the pipe for the child.
+    """
+    line = bytearray()
+    while not line.endswith(b"\n"):
+        byte = os.read(0, 1)
+        if not byte:
+            return None
+        line += byte
+        if len(line) > MAX_HEADER_BYTES:
+            raise ValueError("Request header too long")
+    return json.loads(line)
+
+
+def read_payload(size):
+    """The job's payload from stdin, read in the child"""
+    data = bytearray()
+    while len(data) < size:
+        chunk = os.read(0, size - len(data))
+        if not chunk:
+            raise EOFError("Request payload cut short")
+        data += chunk
+    return json.loads(data)
+
+
+def send(message):
+    """Write one protocol message to the worker"""
+    sys.stdout.write(json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+
+def run_child(size, home, loaded_w, out_w, err_w):
+    """
+    Runs in the forked child: reads the job from stdin, sets up its workdir
+    and runs it. Never returns.
+    """
+    exit_code = 1
+    try:
+        os.setsid()
+
+        request = read_payload(size)
+        os.write(loaded_w, b"1")
+        os.close(loaded_w)
+        code, filename = request["code"], request["filename"]
+
+        # Only the zygote is kept undumpable, the job gets the usual /proc/self
+        prctl(PR_SET_DUMPABLE, 1, "PR_SET_DUMPABLE")
+
+        # Keep the source on disk so tracebacks can show the offending line
+        workdir = tempfile.mkdtemp(dir=home)
+        with open(os.path.join(workdir, filename), "w") as f:
+            f.write(code)
+
+        # Job input from an unlinked file, so the job never blocks on a pipe
+        if request.get("stdin") is not None:
+            stdin_file = tempfile.TemporaryFile(dir=home)
+            stdin_file.write(request["stdin"].encode())
+            stdin_file.seek(0)
+            in_fd = stdin_file.fileno()
+        else:
+            in_fd = os.open(os.devnull, os.O_RDONLY)
+        del request
+
+        # Protocol pipes are replaced by the job's own stdio
+        os.dup2(in_fd, 0)
+        os.dup2(out_w, 1)
+        os.dup2(err_w, 2)
+        os.closerange(3, 256)
+
+        # Same limits firejail applies to a cold run
+        resource.setrlimit(resource.RLIMIT_AS, (RLIMIT_AS, RLIMIT_AS))
+        resource.setrlimit(resource.RLIMIT_CPU, (RLIMIT_CPU, RLIMIT_CPU))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (RLIMIT_FSIZE, RLIMIT_FSIZE))
+
+        os.chdir(workdir)
+        sys.stdin = open(0, "r", closefd=False)
+        sys.stdout = open(1, "w", closefd=False)
+        sys.stderr = open(2, "w", closefd=False)
+        sys.argv = [filename]
+        sys.path[0] = workdir
+
+        # Fresh __main__ so the job does not see the zygote's globals
+        main = types.ModuleType("__main__")
+        main.__file__ = filename
+        main.__builtins__ = __builtins__
+        sys.modules["__main__"] = main
+
+        try:
+            exec(compile(code, filename, "exec"), main.__dict__)
+            exit_code = 0
+        except SystemExit as e:
+            if e.code is None:
+                exit_code = 0
+            elif isinstance(e.code, int):
+                exit_code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except BaseException as e:
+            # Drop this frame so the traceback looks like a plain `python3 file`
+            traceback.print_exception(type(e), e, e.__traceback__.tb_next)
+            exit_code = 1
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(exit_code & 0xFF)
+
+
+def supervise(request, home, loaded_w, result_w):
+    """
+    Runs in a forked supervisor, one per job: forks the job's child, relays
+    its output and writes the exit status to result_w. The job's output only
+    ever passes through this process, which exits right after. Never returns.
+    """
+    try:
+        job_id = request.get("id")
+        timeout = request.get("timeout", 10)
+
+        out_r, out_w = os.pipe()
+        err_r, err_w = os.pipe()
+
+        sys.stdout.flush()
+        pid = os.fork()
+        if pid == 0:
+            os.close(out_r)
+            os.close(err_r)
+            os.close(result_w)
+            run_child(request["size"], home, loaded_w, out_w, err_w)
+
+        os.close(out_w)
+        os.close(err_w)
+        os.close(loaded_w)
+
+        # Output past the limit stops the child, like a cold run
+        output_limit = request.get("output_limit", OUTPUT_LIMIT_BYTES)
+        streams = {
+            out_r: ("stdout", OutputBuffer(output_limit)),
+            err_r: ("stderr", OutputBuffer(output_limit)),
+        }
+        buffers = dict(streams.values())
+
+        def relay(fd):
+            """Forward one read from fd, returns True once the output limit is hit"""
+            name, buffer = streams[fd]
+            chunk = os.read(fd, READ_SIZE)
+            data = buffer.append(chunk) if chunk else buffer.close()
+            if data:
+                send({"type": "output", "id": job_id, "stream": name, "data": data})
+            if not chunk:
+                os.close(fd)
+                del streams[fd]
+            return buffer.truncated
+
+        # The job ends when the child exits, not at EOF: a grandchild holding
+        # the pipes open must not keep the job running until its timeout
+        try:
+            exit_fd = os.pidfd_open(pid)
+        except (AttributeError, OSError):
+            exit_fd = None
+
+        deadline = time.monotonic() + timeout
+        timed_out = False
+        stopped = False
+        status = None
+
+        while status is None and not stopped:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+
+            watched = list(streams) + ([exit_fd] if exit_fd is not None else [])
+            wait = remaining if exit_fd is not None else min(remaining, EXIT_POLL_INTERVAL)
+            ready, _, _ = select.select(watched, [], [], wait)
+            for fd in ready:
+                if fd != exit_fd and relay(fd):
+                    stopped = True
+                    break
+
+            waited, wait_status, wait_rusage = os.wait4(pid, os.WNOHANG)
+            if waited:
+                status, rusage = wait_status, wait_rusage
+
+        if status is None:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            _, status, rusage = os.wait4(pid, 0)
+
+        # What the child wrote before exiting may still be in the pipes, read
+        # what is there without waiting on processes it left behind
+        while streams and not (timed_out or stopped):
+            ready, _, _ = select.select(list(streams), [], [], 0)
+            if not ready:
+                break
+            for fd in ready:
+                if relay(fd):
+                    stopped = True
+                    break
+
+        os.write(result_w, json.dumps({
+            "exit_code": os.waitstatus_to_exitcode(status),
+            "cpu_user_time": rusage.ru_utime,
+            "cpu_sys_time": rusage.ru_stime,
+            "max_rss_bytes": rusage.ru_maxrss * 1024,
+            "timed_out": timed_out,
+            "truncated": {name: buffer.truncated for name, buffer in buffers.items()},
+        }).encode())
+        sys.stdout.flush()
+    finally:
+        os._exit(0)
+
+
+def run_job(request, home):
+    """
+    Run one job through a supervisor and clean up after it. Returns False
+    when the zygote must not take another job: processes or files of this
+    one could not be removed, or its payload was not read off stdin.
+    """
+    job_id = request.get("id")
+    loaded_r, loaded_w = os.pipe()
+    result_r, result_w = os.pipe()
+
+    sys.stdout.flush()
+    pid = os.fork()
+    if pid == 0:
+        os.close(loaded_r)
+        os.close(result_r)
+        supervise(request, home, loaded_w, result_w)
+
+    os.close(loaded_w)
+    os.close(result_w)
+    try:
+        os.waitpid(pid, 0)
+        result = b""
+        while chunk := os.read(result_r, READ_SIZE):
+            result += chunk
+
+        # Nothing the job started may outlive it, the sandbox is shared with later jobs
+        clean = kill_strays()
+        try:
+            scrub(home)
+        except OSError:
+            clean = False
+        # The child reports once it has read its payload, else the rest of it is still on stdin
+        if os.read(loaded_r, 1) != b"1":
+            clean = False
+    finally:
+        os.close(loaded_r)
+        os.close(result_r)
+
+    if not result:
+        # The supervisor was killed, the job's status is lost
+        send({"type": "error", "id": job_id, "error": "Job supervisor died"})
+        return False
+
+    send({"type": "exit", "id": job_id, **json.loads(result), "recycle": not clean})
+    return clean
+
+
+def serve():
+    home = os.path.expanduser("~")
+    try:
+        become_subreaper()
+    except OSError as e:
+        # Without it leftover processes can't be found, the worker falls back to cold runs
+        send({"type": "error", "error": str(e)})
+        return
+    preload()
+    # Jobs can't read the zygote's memory through /proc
+    prctl(PR_SET_DUMPABLE, 0, "PR_SET_DUMPABLE")
+    send({"type": "ready", "pid": os.getpid()})
+
+    while True:
+        try:
+            request = read_header()
+        except ValueError:
+            # Out of step with the worker, it restarts the zygote on errors
+            send({"type": "error", "error": "Invalid request"})
+            return
+        if request is None:
+            return
+
+        try:
+            if not run_job(request, home):
+                return
+        except Exception as e:
+            send({"type": "error", "id": request.get("id"), "error": str(e)})
+            return
+
+
+if __name__ == "__main__":
+    serve()
@@ -1,18 +1,24 @@
 import subprocess
 import os
-import tempfile
+import time
 import re
 
 from firejail import firejail_execute
+from workspace import workspace_pool
+from compile_cache import compile_cache
+from grading import run_test_cases
+from profiles import profile_flags
 
 
-def execute_code(code: str, filename: str):
+def execute_code(code: str, filename: str, on_output=None, profile=None, test_cases=None):
     """
     Rust Sandbox.
     Create temp directory. Write code to file in dir. Compile and run code in firejail.   
+    With test_cases it is compiled once and run once per case.
+    profile picks the compile flags (fast-compile debug build or optimized).
     """
 
-    with tempfile.TemporaryDirectory() as tmpdir:
+    with workspace_pool.workspace() as tmpdir:
 
         if not re.match(r'^[a-zA-Z0-9_.-]+$', filename):
             return {
@@ -30,26 +36,42 @@ def execute_code(code: str, filename: str):
         
         try:
             # Compile Rust code
-            compile_result = subprocess.run(
-                ["rustc", file_path, "-o", output_path],
-                capture_output=True,
-                text=True,
-                timeout=15
+            profile, flags = profile_flags("rust", profile)
+            compile_cmd = ["rustc", *flags, filename, "-o", "a.out"]
+            start_time = time.time()
+            returncode, compile_stderr, cache_stats = compile_cache.compile(
+                compile_cmd, code, tmpdir, "a.out", timeout=15
             )
+            compile_time = time.time() - start_time
             
-            if compile_result.returncode != 0:
+            if returncode != 0:
                 return {
                     "success": False,
                     "stdout": "",
-                    "stderr": f"Compilation error:\n{compile_result.stderr}",
-                    "exit_code": compile_result.returncode
+                    "stderr": f"Compilation error:\n{compile_stderr}",
+                    "exit_code": returncode,
+                    "compile_cache": cache_stats,
+                    "profile": profile,
+                    "compile_time": compile_time
                 }
             
             # Set executable permissions
             os.chmod(output_path, 0o755)
             
             # Run executable in Firejail
-            return firejail_execute([output_path], tmpdir)
+            if test_cases:
+                result = run_test_cases(
+                    lambda stdin, output_limit, timeout: firejail_execute(
+                        [output_path], tmpdir, timeout=timeout, on_output=on_output, stdin=stdin, output_limit=output_limit
+                    ),
+                    test_cases
+                )
+            else:
+                result = firejail_execute([output_path], tmpdir, on_output=on_output)
+            result["compile_time"] = compile_time
+            result["profile"] = profile
+            result["compile_cache"] = cache_stats
+            return result
             
         except subprocess.TimeoutExpired:
             return {